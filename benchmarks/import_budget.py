@@ -0,0 +1,63 @@
+"""
+Import-time budget check for main.py.
+
+Imports main in a fresh interpreter (as n8n / the scheduled task do with
+`python main.py`), and fails if it takes longer than the budget or pulls in
+a heavy provider SDK that should only load on first use.
+
+    python benchmarks/import_budget.py               # budget: IMPORT_BUDGET_MS or 600 ms
+    python benchmarks/import_budget.py --budget-ms 400 --runs 5
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Must not be imported by `import main`; they load through modules.providers
+LAZY_MODULES = ("moviepy", "google.generativeai", "openai", "elevenlabs", "edge_tts", "numpy")
+
+PROBE = """
+import sys, time, json
+sys.argv = ["main.py"]
+start = time.perf_counter()
+import main
+elapsed = time.perf_counter() - start
+print(json.dumps({"ms": elapsed * 1000, "loaded": [m for m in %r if m in sys.modules]}))
+""" % (LAZY_MODULES,)
+
+
+def measure() -> dict:
+    result = subprocess.run([sys.executable, "-c", PROBE], cwd=ROOT, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip()[-800:])
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import-time budget check for main.py")
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("IMPORT_BUDGET_MS", "600")))
+    parser.add_argument("--runs", type=int, default=3, help="Best of N (the first run warms the OS file cache)")
+    args = parser.parse_args()
+
+    samples = [measure() for _ in range(max(args.runs, 1))]
+    best = min(s["ms"] for s in samples)
+    loaded = sorted({m for s in samples for m in s["loaded"]})
+    print(f"import main: {best:.0f} ms (best of {len(samples)}, budget {args.budget_ms:.0f} ms)")
+
+    failed = False
+    if loaded:
+        print(f"FAIL: heavy modules imported eagerly: {', '.join(loaded)}")
+        failed = True
+    if best > args.budget_ms:
+        print(f"FAIL: over budget by {best - args.budget_ms:.0f} ms")
+        failed = True
+    if not failed:
+        print("OK")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
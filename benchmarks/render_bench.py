@@ -0,0 +1,249 @@
+"""
+Offline render benchmark for VideoEditor.create_multiclip_video.
+
+Synthesizes deterministic inputs with ffmpeg (1080x1920 noise clips, sine
+narration of varying lengths, a music bed and a disclaimer image), renders
+them under several configurations and records render seconds per output
+second and peak memory. Each configuration runs in its own process with an
+empty cache, so numbers are cold-start and isolated. No network or API keys.
+
+    python benchmarks/render_bench.py                      # ffmpeg + parallel, 3 and 8 segments
+    python benchmarks/render_bench.py --engines moviepy ffmpeg parallel --segments 3 8 15
+    python benchmarks/render_bench.py --save-baseline       # store results as the new baseline
+
+Results go to benchmarks/results/<timestamp>.json and are compared against
+benchmarks/baseline.json; the exit code is 1 if any configuration regressed
+by more than --tolerance.
+"""
+import os
+import sys
+import json
+import random
+import shutil
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+BASELINE_PATH = os.path.join(BENCH_DIR, "baseline.json")
+
+# Baseline configuration and one-factor-at-a-time variations of it
+BASE_CONFIG = {"remove_watermark": True, "music": False, "disclaimer": False, "threads": 0, "preset": "ultrafast"}
+VARIATIONS = [
+    {},
+    {"remove_watermark": False},
+    {"music": True},
+    {"disclaimer": True},
+    {"threads": 2},
+    {"preset": "veryfast"},
+]
+
+
+def _ffmpeg(*args):
+    from modules.ffmpeg_renderer import get_ffmpeg_exe
+    subprocess.run([get_ffmpeg_exe(), "-y", "-hide_banner", "-loglevel", "error", *args], check=True)
+
+
+def synthesize_inputs(workdir: str, n_segments: int, seed: int = 0) -> dict:
+    """
+    Writes n_segments (clip, narration) pairs plus music and images to workdir.
+    Same (n_segments, seed) -> same inputs. Returns paths.
+    """
+    rng = random.Random(seed)
+    os.makedirs(workdir, exist_ok=True)
+    segments = []
+    for i in range(n_segments):
+        clip_s = round(rng.uniform(2.0, 6.0), 2)
+        narration_s = round(rng.uniform(1.5, 5.0), 2)
+        video = os.path.join(workdir, f"clip_{i}.mp4")
+        audio = os.path.join(workdir, f"voice_{i}.mp3")
+        if not os.path.exists(video):
+            # Noise keeps the clip above the mock-file size threshold and stresses the encoder
+            _ffmpeg("-f", "lavfi", "-i", f"color=c=0x{rng.randrange(1 << 24):06x}:s=1080x1920:r=30:d={clip_s}",
+                    "-vf", f"noise=alls=25:allf=t+u:all_seed={seed + i}", "-c:v", "libx264", "-preset", "ultrafast",
+                    "-pix_fmt", "yuv420p", video)
+        if not os.path.exists(audio):
+            _ffmpeg("-f", "lavfi", "-i", f"sine=frequency={200 + 40 * i}:duration={narration_s}",
+                    "-c:a", "libmp3lame", "-b:a", "128k", audio)
+        segments.append({"audio": audio, "video": video})
+
+    music = os.path.join(workdir, "music.mp3")
+    if not os.path.exists(music):
+        _ffmpeg("-f", "lavfi", "-i", "sine=frequency=110:duration=20", "-c:a", "libmp3lame", "-b:a", "128k", music)
+
+    # Assets dir holding only the fallback image; the disclaimer lives in a second copy
+    plain_assets = os.path.join(workdir, "assets_plain")
+    disclaimer_assets = os.path.join(workdir, "assets_disclaimer")
+    for assets in (plain_assets, disclaimer_assets):
+        os.makedirs(assets, exist_ok=True)
+        fallback = os.path.join(assets, "fallback_background.png")
+        if not os.path.exists(fallback):
+            _ffmpeg("-f", "lavfi", "-i", "color=c=0x202040:s=1080x1920", "-frames:v", "1", fallback)
+    disclaimer = os.path.join(disclaimer_assets, "disclaimer.png")
+    if not os.path.exists(disclaimer):
+        _ffmpeg("-f", "lavfi", "-i", "color=c=white:s=1000x140", "-frames:v", "1", disclaimer)
+
+    return {"segments": segments, "music": music, "assets_plain": plain_assets, "assets_disclaimer": disclaimer_assets}
+
+
+def config_name(engine: str, n_segments: int, config: dict) -> str:
+    flags = [("wm" if config["remove_watermark"] else "nowm"),
+             ("music" if config["music"] else "nomusic"),
+             ("disc" if config["disclaimer"] else "nodisc"),
+             f"t{config['threads']}", config["preset"]]
+    return f"{engine}/{n_segments}seg/{'-'.join(flags)}"
+
+
+def run_one(spec: dict) -> dict:
+    """Renders one configuration in this process. Returns its measurements."""
+    import time
+
+    # Cold cache for every configuration (the parallel engine caches segments)
+    os.environ["CACHE_DIR"] = spec["cache_dir"]
+    from modules.video_editor import VideoEditor
+    from modules.ffmpeg_renderer import probe_media
+    # resource is Unix-only; peak memory is reported as None elsewhere
+    from modules.metrics import resource, _peak_rss_mb
+
+    inputs = spec["inputs"]
+    config = spec["config"]
+    random.seed(spec["seed"])  # Punch-in choices are random
+    editor = VideoEditor(
+        engine=spec["engine"], preset=config["preset"], threads=config["threads"] or None,
+        assets_dir=inputs["assets_disclaimer"] if config["disclaimer"] else inputs["assets_plain"],
+    )
+    start_wall, start_times = time.monotonic(), os.times()
+    output = editor.create_multiclip_video(
+        inputs["segments"], spec["output"],
+        bg_music_path=inputs["music"] if config["music"] else None,
+        remove_watermark=config["remove_watermark"],
+    )
+    wall = time.monotonic() - start_wall
+    end_times = os.times()
+    if not output or not os.path.exists(output):
+        return {"error": "render produced no output"}
+
+    duration = probe_media(output).get("duration") or 0.0
+    cpu = (end_times.user + end_times.system + end_times.children_user + end_times.children_system) - \
+          (start_times.user + start_times.system + start_times.children_user + start_times.children_system)
+    return {
+        "render_s": round(wall, 3),
+        "cpu_s": round(cpu, 3),
+        "output_s": round(duration, 3),
+        "render_s_per_output_s": round(wall / duration, 4) if duration else None,
+        "peak_rss_mb": _peak_rss_mb(resource.RUSAGE_SELF) if resource else None,
+        "child_peak_rss_mb": _peak_rss_mb(resource.RUSAGE_CHILDREN) if resource else None,
+        "output_mb": round(os.path.getsize(output) / (1024 * 1024), 2),
+    }
+
+
+def run_isolated(spec: dict) -> dict:
+    result = subprocess.run([sys.executable, os.path.abspath(__file__), "--worker", json.dumps(spec)],
+                            capture_output=True, text=True)
+    # The worker prints its result as the last line; everything before is render logs
+    lines = result.stdout.strip().splitlines()
+    try:
+        return json.loads(lines[-1])
+    except (IndexError, json.JSONDecodeError):
+        return {"error": (result.stderr or result.stdout).strip()[-500:]}
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Returns human-readable regressions of results vs. baseline."""
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if not previous or "error" in current or "error" in previous:
+            continue
+        for metric in ("render_s_per_output_s", "child_peak_rss_mb"):
+            old, new = previous.get(metric), current.get(metric)
+            if old and new and new > old * (1 + tolerance):
+                regressions.append(f"{name}: {metric} {old} -> {new} (+{(new / old - 1):.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline render benchmark")
+    parser.add_argument("--engines", nargs="+", default=["ffmpeg", "parallel"], choices=["moviepy", "ffmpeg", "parallel"])
+    parser.add_argument("--segments", nargs="+", type=int, default=[3, 8], help="Segment counts to benchmark (3-15)")
+    parser.add_argument("--base-only", action="store_true", help="Only the base configuration, no variations")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed slowdown vs. baseline (default 15%%)")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="Write these results as the new baseline")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_one(json.loads(args.worker))))
+        return 0
+
+    workdir = tempfile.mkdtemp(prefix="render_bench_")
+    results = {}
+    try:
+        for n_segments in args.segments:
+            print(f"Synthesizing inputs for {n_segments} segments...")
+            inputs = synthesize_inputs(os.path.join(workdir, f"inputs_{n_segments}"), n_segments, args.seed)
+            for engine in args.engines:
+                for variation in (VARIATIONS[:1] if args.base_only else VARIATIONS):
+                    config = dict(BASE_CONFIG, **variation)
+                    name = config_name(engine, n_segments, config)
+                    spec = {
+                        "engine": engine, "config": config, "inputs": inputs, "seed": args.seed,
+                        "output": os.path.join(workdir, "out.mp4"),
+                        "cache_dir": tempfile.mkdtemp(prefix="cache_", dir=workdir),
+                    }
+                    results[name] = run_isolated(spec)
+                    shutil.rmtree(spec["cache_dir"], ignore_errors=True)
+                    r = results[name]
+                    if "error" in r:
+                        print(f"  {name:<55} ERROR {r['error'][:200]}")
+                    else:
+                        rss = f"{r['child_peak_rss_mb']}MB" if r['child_peak_rss_mb'] is not None else "n/a"
+                        print(f"  {name:<55} {r['render_s_per_output_s']:.3f} s/s  "
+                              f"({r['render_s']:.1f}s for {r['output_s']:.1f}s, child RSS {rss})")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    report = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "cpu_count": os.cpu_count(),
+        "seed": args.seed,
+        "results": results,
+    }
+    out_path = os.path.join(RESULTS_DIR, f"{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    with open(out_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {out_path}")
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline updated: {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("No baseline yet. Run with --save-baseline to create one.")
+        return 0
+    with open(args.baseline, 'r') as f:
+        baseline = json.load(f)
+    if baseline.get("cpu_count") != os.cpu_count():
+        print(f"Note: baseline was recorded on {baseline.get('cpu_count')} CPUs, this machine has {os.cpu_count()}.")
+    regressions = compare(results, baseline.get("results", {}), args.tolerance)
+    if regressions:
+        print("REGRESSIONS:")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+    print(f"No regressions against baseline (tolerance {args.tolerance:.0%}).")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,206 @@
+"""
+Offline check of the resumable upload protocol (ResumableHTTPUploader).
+
+Starts a local stand-in for a resumable upload endpoint (POST creates a
+session, PUT with Content-Range appends, "bytes */total" queries the committed
+offset) and injects failures:
+
+  mid-chunk   the server commits part of a chunk, then drops the connection;
+              the uploader must resume from the server's reported offset
+  restart     the upload gives up after a failure; a second upload with the
+              same state file must resume the saved session, not start over
+
+Both must finish with the server holding exactly the original bytes, and every
+resumed PUT must start at the offset the server reported. No network access.
+
+    python benchmarks/upload_resume_check.py
+    python benchmarks/upload_resume_check.py --size-kb 4096 --chunk-kb 256
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+class StandInServer:
+    """Resumable upload endpoint that can drop a chosen PUT after committing part of it."""
+
+    def __init__(self):
+        self.sessions = {}  # id -> bytearray of committed bytes
+        self.puts = []  # (session id, start offset) of every data PUT, in order
+        self.queries = []  # committed offsets reported to "bytes */total" queries
+        self.fail_at = set()  # indexes into `puts` to drop mid-body
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status, headers=None, body=b""):
+                self.send_response(status)
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                with server._lock:
+                    session_id = str(len(server.sessions) + 1)
+                    server.sessions[session_id] = bytearray()
+                self._reply(200, {"Location": f"http://127.0.0.1:{server.port}/upload/{session_id}"})
+
+            def _committed_reply(self, received: bytearray, total: int):
+                if len(received) >= total:
+                    self._reply(201, {"Content-Type": "application/json"}, b'{"id": "video-1"}')
+                elif received:
+                    self._reply(308, {"Range": f"bytes=0-{len(received) - 1}"})
+                else:
+                    self._reply(308)
+
+            def do_PUT(self):
+                session_id = self.path.rsplit("/", 1)[1]
+                spec = self.headers["Content-Range"].split(" ", 1)[1]  # "a-b/total" or "*/total"
+                span, total = spec.split("/")
+                length = int(self.headers.get("Content-Length", 0))
+                received = server.sessions[session_id]
+                if span == "*":
+                    self.rfile.read(length)
+                    server.queries.append(len(received))
+                    return self._committed_reply(received, int(total))
+
+                start = int(span.split("-")[0])
+                with server._lock:
+                    index = len(server.puts)
+                    server.puts.append((session_id, start))
+                if start != len(received):
+                    self.rfile.read(length)
+                    return self._reply(400, body=b"offset mismatch")
+                if index in server.fail_at:
+                    # Commit a partial chunk (not on a chunk boundary), then vanish without replying
+                    kept = max(length // 3, 1)
+                    received += self.rfile.read(kept)
+                    self.close_connection = True
+                    self.connection.shutdown(2)
+                    return
+                received += self.rfile.read(length)
+                self._committed_reply(received, int(total))
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.port = self.httpd.server_address[1]
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def make_uploader(server: StandInServer, chunk_size: int, max_chunk_retries: int = None):
+    from modules.http_client import HTTPClient
+    from modules.uploader import ResumableHTTPUploader
+    uploader = ResumableHTTPUploader(f"http://127.0.0.1:{server.port}/init",
+                                     http=HTTPClient(retries=1, backoff=0.05, read_timeout=10))
+    uploader.chunk_size = chunk_size
+    if max_chunk_retries is not None:
+        uploader.max_chunk_retries = max_chunk_retries
+    return uploader
+
+
+def resumed_at_reported_offsets(server: StandInServer, chunk_size: int) -> list:
+    """Problems with the PUT offsets: each dropped PUT must be followed by one at the offset the server reported."""
+    problems = []
+    for index in sorted(server.fail_at):
+        if index + 1 >= len(server.puts):
+            problems.append(f"no PUT after the dropped one (#{index})")
+            continue
+        dropped_start = server.puts[index][1]
+        resumed_start = server.puts[index + 1][1]
+        expected = dropped_start + max(chunk_size // 3, 1)
+        if resumed_start != expected:
+            problems.append(f"PUT after the drop started at {resumed_start}, server had committed {expected}")
+    return problems
+
+
+def check_mid_chunk(data: bytes, chunk_size: int) -> list:
+    server = StandInServer()
+    try:
+        server.fail_at = {2}
+        video_id = make_uploader(server, chunk_size).upload_resumable(memoryview(data), "t", "d")
+        problems = resumed_at_reported_offsets(server, chunk_size)
+        if video_id != "video-1":
+            problems.append(f"video id {video_id!r}")
+        if bytes(server.sessions["1"]) != data:
+            problems.append("server bytes differ from the source")
+        if len(server.sessions) != 1:
+            problems.append(f"{len(server.sessions)} sessions opened, expected 1")
+        return problems
+    finally:
+        server.close()
+
+
+def check_restart(data: bytes, chunk_size: int, state_path: str) -> list:
+    server = StandInServer()
+    try:
+        server.fail_at = {1}
+        try:
+            # Gives up on the first failure, like a crashed run
+            make_uploader(server, chunk_size, max_chunk_retries=0).upload_resumable(memoryview(data), "t", "d", state_path)
+            return ["first upload was expected to fail"]
+        except Exception:
+            pass
+        if not os.path.exists(state_path):
+            return ["no session state saved after the failure"]
+        video_id = make_uploader(server, chunk_size).upload_resumable(memoryview(data), "t", "d", state_path)
+        problems = resumed_at_reported_offsets(server, chunk_size)
+        if video_id != "video-1":
+            problems.append(f"video id {video_id!r}")
+        if len(server.sessions) != 1:
+            problems.append(f"{len(server.sessions)} sessions opened, expected the saved one to be resumed")
+        if bytes(server.sessions["1"]) != data:
+            problems.append("server bytes differ from the source")
+        if os.path.exists(state_path):
+            problems.append("session state left behind after completion")
+        return problems
+    finally:
+        server.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline resumable upload check")
+    parser.add_argument("--size-kb", type=int, default=1024)
+    parser.add_argument("--chunk-kb", type=int, default=128)
+    args = parser.parse_args()
+
+    data = os.urandom(args.size_kb * 1024)
+    chunk_size = args.chunk_kb * 1024
+    workdir = tempfile.mkdtemp(prefix="upload_check_")
+    failed = False
+    try:
+        for name, check in (("mid-chunk", lambda: check_mid_chunk(data, chunk_size)),
+                            ("restart", lambda: check_restart(data, chunk_size, os.path.join(workdir, "session.json")))):
+            start = time.monotonic()
+            try:
+                problems = check()
+            except Exception as e:
+                problems = [f"upload raised {e.__class__.__name__}: {e}"]
+            status = "OK" if not problems else "FAIL"
+            print(f"  {name:<10} {status} ({time.monotonic() - start:.1f}s)")
+            for problem in problems:
+                print(f"    - {problem}")
+            failed = failed or bool(problems)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,5 @@
 import os
 import sys
-import requests
-import subprocess
 try:
     from dotenv import load_dotenv
 except ImportError:
@@ -13,45 +11,64 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from modules.idea_generator import IdeaGenerator
 from modules.asset_generator import AssetGenerator
+from modules.asset_pipeline import AssetPipeline
 from modules.video_editor import VideoEditor
 from modules.uploader import YouTubeUploader, TikTokUploader, InstagramUploader, FacebookUploader
+from modules.distributor import UploadDistributor
 from modules.engagement import EngagementManager
 from modules.analytics import FeedbackLoop
+from modules.history_store import HistoryService
+from modules.run_manager import RunManifest
+from modules.http_client import get_client
+from modules.ffmpeg_renderer import OUTPUT_PROFILES, size_capped_copy
 
+import shutil
 import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+# Renders live in runs/<run-id>/; the newest one is also published here for
+# consumers that read a fixed path (the n8n delivery workflow's "Read Video File")
+LATEST_VIDEO_PATH = os.getenv("LATEST_VIDEO_PATH",
+                              os.path.join(os.path.dirname(os.path.abspath(__file__)), "final_viral_video.mp4"))
+
+
+def publish_latest_video(video_path):
+    """Hard-links (or copies, across filesystems) the rendered master to LATEST_VIDEO_PATH."""
+    if os.path.abspath(video_path) == os.path.abspath(LATEST_VIDEO_PATH):
+        return
+    try:
+        if os.path.lexists(LATEST_VIDEO_PATH):
+            os.remove(LATEST_VIDEO_PATH)
+        try:
+            os.link(video_path, LATEST_VIDEO_PATH)
+        except OSError:
+            shutil.copy2(video_path, LATEST_VIDEO_PATH)
+    except OSError as e:
+        print(f"Warning: could not publish video to {LATEST_VIDEO_PATH}: {e}")
 
 def send_telegram_video(video_path, caption):
-    """Sends the final video to Telegram via Bot API."""
+    """
+    Sends the final video to Telegram via Bot API. Returns True when delivered,
+    "skipped" without credentials, and None if delivery failed.
+    """
     token = os.getenv("TELEGRAM_BOT_TOKEN")
     chat_id = os.getenv("TELEGRAM_CHAT_ID")
     
     if not token or not chat_id:
         print("Telegram credentials missing in .env. Skipping mobile delivery.")
-        return
+        return "skipped"
 
-    # 1. Check Size & Compress if needed (> 50MB)
-    max_size = 45 * 1024 * 1024 # 45MB safety threshold
-    current_size = os.path.getsize(video_path)
+    # 1. Fit the Bot API limit (50MB). A master that fits is sent as is; otherwise
+    # a size-targeted encode is made once and cached next to the master, so
+    # re-deliveries reuse it.
+    profile = OUTPUT_PROFILES["telegram"]
     final_path = video_path
-
-    if current_size > max_size:
-        print(f"⚠️ Video size ({current_size / (1024*1024):.1f}MB) exceeds Telegram Bot limit. Compressing...")
-        final_path = video_path.replace(".mp4", "_compressed.mp4")
-        # Find FFmpeg binary
-        try:
-            import imageio_ffmpeg
-            ffmpeg_bin = imageio_ffmpeg.get_ffmpeg_exe()
-            cmd = [
-                ffmpeg_bin, '-y', '-i', video_path,
-                '-vcodec', 'libx264', '-crf', '28', 
-                '-preset', 'fast', '-acodec', 'aac', '-b:a', '128k',
-                final_path
-            ]
-            subprocess.run(cmd, check=True, capture_output=True)
-            print(f"✅ Compression complete: {os.path.getsize(final_path) / (1024*1024):.1f}MB")
-        except Exception as e:
-            print(f"❌ Compression failed: {e}. Attempting original send anyway.")
-            final_path = video_path
+    try:
+        final_path = size_capped_copy(video_path, profile["max_mb"], profile["audio_bitrate"])
+        if final_path != video_path:
+            print(f"✅ Size-targeted encode ready: {os.path.getsize(final_path) / (1024*1024):.1f}MB")
+    except Exception as e:
+        print(f"❌ Size-targeted encode failed: {e}. Attempting original send anyway.")
 
     # 2. Send to Telegram
     print(f"Sending video to Telegram chat {chat_id}...")
@@ -61,18 +78,242 @@ def send_telegram_video(video_path, caption):
         with open(final_path, 'rb') as video_file:
             files = {'video': video_file}
             data = {'chat_id': chat_id, 'caption': caption}
-            response = requests.post(url, files=files, data=data, timeout=60)
+            # A read timeout may come after Telegram accepted the video, so only failures
+            # before that (connect errors, 429/5xx) are retried; the file is rewound
+            response = get_client().post(url, files=files, data=data, timeout=(10, 300), retry="connect")
             
             if response.status_code == 200:
                 print("✅ Video successfully delivered to Telegram!")
-            else:
-                print(f"❌ Telegram delivery failed: {response.text}")
+                return True
+            print(f"❌ Telegram delivery failed: {response.text}")
     except Exception as e:
         print(f"❌ Error sending to Telegram: {e}")
-    finally:
-        # Cleanup compressed file
-        if final_path != video_path and os.path.exists(final_path):
-            os.remove(final_path)
+    return None
+
+class PipelineContext:
+    """Generators, editor and uploaders shared by every video in one invocation."""
+
+    def __init__(self, args):
+        self.args = args
+        # History is loaded once and shared by the feedback loop and idea generator
+        self.history = HistoryService()
+        self.feedback = FeedbackLoop(history=self.history)
+        self.insights = self.feedback.analyze_and_refine()
+        self.idea_gen = IdeaGenerator(history=self.history)
+        self.asset_gen = AssetGenerator()
+        self.editor = VideoEditor(engine=args.render_engine)
+        self.uploaders = [
+            YouTubeUploader(), 
+            TikTokUploader(), 
+            InstagramUploader(),
+            FacebookUploader()
+        ]
+        self._trends = None
+
+    def trends(self) -> list:
+        """Trend scan is done once per invocation and shared by all 'Auto' videos."""
+        if self._trends is None:
+            print("\n--- 1. MARKET REFLEX SCANNING ---")
+            self._trends = self.idea_gen.scan_for_trends("Trading & Finance")
+            print(f"Top 5 Viral Trends Detected:")
+            for i, t in enumerate(self._trends):
+                print(f"  {i+1}. {t}")
+        return self._trends
+
+
+def prepare_video(ctx, run, topic, index=0, batch_ideas=None):
+    """
+    Stages 1-3: topic, research, script and assets. Returns (idea, segments_data).
+    batch_ideas: ideas of earlier videos in this batch, which the new one must not repeat.
+    """
+    def _pick_topic():
+        if not topic.strip() or topic.lower() == "auto":
+            # Autonomous Selection: #1 Trend for the first video, #2 for the next...
+            trends = ctx.trends()
+            locked = trends[index % len(trends)]
+            print(f"\nLocked Target: {locked}")
+            return locked
+        return topic
+
+    video_topic = run.run_stage("topic", _pick_topic)
+
+    print(f"\n--- 2. DEEP DIVE RESEARCH [{video_topic}] ---")
+    research = run.run_stage("research", lambda: ctx.idea_gen.deep_research(video_topic))
+    print(f"Research Attributes:\n{research[:500]}...") # Show snippet
+    
+    # Cached assets may have been evicted since the checkpoint
+    if any(not os.path.exists(seg[k]) for seg in run.get("assets", []) for k in ("audio", "video")):
+        run.invalidate("assets")
+
+    # Audio (ElevenLabs or Edge-TTS) and video (Pexels) fetches start for each
+    # segment as soon as it is streamed from the model, while the rest of the
+    # script is still generating
+    pipeline = AssetPipeline(ctx.asset_gen, max_workers=ctx.args.asset_workers)
+    with pipeline.stream(default_keyword=video_topic) as assets:
+        print(f"\n--- 3. VIRAL SCRIPT GENERATION [{video_topic}] ---")
+        on_segment = assets.submit if not run.is_done("assets") else None
+        idea = run.run_stage("script", lambda: ctx.idea_gen.generate_idea(video_topic, research_context=research, on_segment=on_segment, batch_ideas=batch_ideas))
+
+        if not idea:
+            print("Failed to generate idea.")
+            return None, None
+
+        print(f"HOOK: {idea['hook_text']}")
+
+        # 3. Asset Generation (Dynamic Multi-Segment)
+        def _generate_assets():
+            print("Generating assets for each script segment...")
+            script_segments = idea.get('script_segments', [])
+
+            # Fallback if no segments found (e.g. legacy prompt)
+            if not script_segments:
+                script_segments = [{"text": idea['hook_text'], "visual_keyword": "Money"}]
+
+            segments_data = assets.results(script_segments)
+            print(f"TTS cache: {ctx.asset_gen.tts_cache.summary()}")
+            return segments_data
+
+        segments_data = run.run_stage("assets", _generate_assets)
+    return idea, segments_data
+
+
+def finish_video(ctx, run, idea, segments_data):
+    """
+    Stages 4-6 and 8: render, distribution, engagement, Telegram. Returns the
+    uploaded ids, or None if rendering or any platform upload failed (the run
+    can then be resumed to retry just the failed platforms).
+    """
+    # 4. Video Editing (Multi-Clip Assembly)
+    def _render():
+        output_video = run.path_for("final_viral_video.mp4")
+        bg_music = "music.mp3" # User should provide this, or we mock/download
+        if not os.path.exists(bg_music):
+             print("No background music found (skipping).")
+             bg_music = None
+        
+        print("Assembling Hyper-Realistic Video...")
+        try:
+            final_video_path = ctx.editor.create_multiclip_video(segments_data, output_video, bg_music_path=bg_music, idea=idea)
+        except Exception as e:
+            print(f"Editing failed: {e}")
+            final_video_path = None
+
+        if not final_video_path:
+            print("Complex rendering failed. Using simplified backup video.")
+            if os.path.exists("test_output.mp4"):
+                shutil.copy("test_output.mp4", output_video)
+                final_video_path = output_video
+            else:
+                print("No backup video found.")
+                return None
+        return final_video_path
+
+    if run.get("render") and not os.path.exists(run.get("render")):
+        run.invalidate("render")
+    final_video_path = run.run_stage("render", _render)
+    if not final_video_path:
+        return None
+    publish_latest_video(final_video_path)
+
+    # 4b. Per-platform encodes (one decode of the master feeds every profile).
+    # Only for uploaders that really send the file; Telegram gets the master, or a
+    # size-capped copy made on demand when the master is over the Bot API limit.
+    def _encode_profiles():
+        profiles = sorted({u.profile for u in ctx.uploaders if u.profile and not u.mock})
+        if not profiles:
+            return {}
+        try:
+            return ctx.editor.create_profile_outputs(final_video_path, profiles)
+        except Exception as e:
+            print(f"Profile encoding failed ({e}). Using the master file everywhere.")
+            return {}
+
+    if any(not os.path.exists(p) for p in (run.get("encode") or {}).values()):
+        run.invalidate("encode")
+    profile_paths = run.run_stage("encode", _encode_profiles)
+
+    # 5. Distribution
+    def _distribute():
+        # All platforms in parallel; partial uploads resume from the run directory.
+        # Platforms that already succeeded (in an earlier attempt) are not uploaded again.
+        uploaded = run.partial("upload", {})
+        pending = [u for u in ctx.uploaders if not uploaded.get(type(u).__name__)]
+        distributor = UploadDistributor(pending)
+        ids = {**uploaded, **distributor.distribute(final_video_path, idea['title'], idea['description'],
+                                                    state_dir=run.path_for("uploads"), profile_paths=profile_paths)}
+        failed = [name for name, video_id in ids.items() if not video_id]
+        if failed:
+            run.save_partial("upload", ids)
+            print(f"Upload failed for {', '.join(failed)}. Run with --resume {run.run_id} to retry only those.")
+            return None
+        return ids
+
+    uploaded_ids = run.run_stage("upload", _distribute)
+
+    # 6. Engagement (only once every platform has its video, so a resume never comments twice)
+    def _engage():
+        engager = EngagementManager(ctx.uploaders)
+        engager.start_calculated_loop(uploaded_ids, idea['first_comment_question'])
+        return True
+
+    if uploaded_ids is not None:
+        run.run_stage("engagement", _engage)
+
+    # 8. Mobile Delivery (Fail-safe, also when an upload failed)
+    run.run_stage("telegram", lambda: send_telegram_video(final_video_path, f"🚀 AI Video Ready: {idea['title']}"))
+    return uploaded_ids
+
+
+def record_metrics(ctx, run):
+    """Prints the run's stage timings and appends its summary to the history store."""
+    if not run.metrics.ran():
+        # A resume with nothing left to do would only add an empty row to the timing history
+        print("No stages ran. Skipping run metrics.")
+        return
+    run.metrics.save()
+    run.metrics.print_summary()
+    try:
+        ctx.history.record_run(run.metrics.summary())
+    except Exception as e:
+        print(f"Warning: could not record run metrics: {e}")
+
+
+def run_batch(ctx, topics):
+    """
+    Produces one video per topic. Script + assets for video k+1 are prepared in a
+    background thread while video k renders and uploads; history is written once.
+    """
+    completed = []  # (run, idea, uploaded_ids)
+    batch_ideas = []  # Every idea made so far, so later videos don't repeat them
+    runs = [RunManifest() for _ in topics]
+    with ThreadPoolExecutor(max_workers=1) as prep_pool:
+        pending = prep_pool.submit(prepare_video, ctx, runs[0], topics[0], 0)
+        for k, run in enumerate(runs):
+            print(f"\n=== Video {k+1}/{len(topics)} (run {run.run_id}) ===")
+            try:
+                idea, segments_data = pending.result()
+            except Exception as e:
+                print(f"Preparation failed for video {k+1}: {e}")
+                idea, segments_data = None, None
+            if idea:
+                batch_ideas.append(idea)
+            if k + 1 < len(runs):
+                pending = prep_pool.submit(prepare_video, ctx, runs[k+1], topics[k+1], k+1, list(batch_ideas))
+            if not idea or not segments_data:
+                record_metrics(ctx, run)
+                continue
+            uploaded_ids = finish_video(ctx, run, idea, segments_data)
+            if uploaded_ids is not None:
+                completed.append((run, idea, uploaded_ids))
+            record_metrics(ctx, run)
+
+    # 7. Log (one history write for the whole batch)
+    if completed:
+        ctx.feedback.log_uploads([(idea, ids) for _, idea, ids in completed])
+        for run, _, _ in completed:
+            run.complete("log", True)
+    print(f"--- Batch Complete: {len(completed)}/{len(topics)} videos produced ---")
+
 
 def main():
     if load_dotenv:
@@ -82,124 +323,59 @@ def main():
     # Parse CLI Arguments (for n8n Automation)
     parser = argparse.ArgumentParser(description="AI Video Automation")
     parser.add_argument("--topic", type=str, help="Topic for the video (or 'Auto')", default="")
+    parser.add_argument("--asset-workers", type=int, help="Max concurrent TTS/footage downloads (default: ASSET_WORKERS or 4)", default=None)
+    parser.add_argument("--render-engine", choices=["moviepy", "ffmpeg", "parallel"], help="Video render engine (default: RENDER_ENGINE or moviepy)", default=None)
+    parser.add_argument("--resume", type=str, metavar="RUN_ID", help="Resume a previous run (or 'latest'), skipping completed stages", default=None)
+    parser.add_argument("--count", type=int, help="Batch mode: number of videos to produce with --topic (default 1)", default=1)
+    parser.add_argument("--topics-file", type=str, help="Batch mode: file with one topic per line ('Auto' allowed)", default=None)
     args = parser.parse_args()
     print(f"DEBUG: main.py started with topic: '{args.topic}'")
 
-    # 1. Feedback Loop: Get insights
-    feedback = FeedbackLoop()
-    insights = feedback.analyze_and_refine()
-    
-    # 2. Idea Generation
-    idea_gen = IdeaGenerator() 
-    
-    topic = args.topic
-    if not topic:
-         # Fallback to interactive input if no arg provided
-         topic = input("Enter Trading Topic (or press Enter to auto-detect High Momentum Trend): ")
-    
-    if not topic.strip() or topic.lower() == "auto":
-        print("\n--- 1. MARKET REFLEX SCANNING ---")
-        trends = idea_gen.scan_for_trends("Trading & Finance")
-        print(f"Top 5 Viral Trends Detected:")
-        for i, t in enumerate(trends):
-            print(f"  {i+1}. {t}")
-        
-        # Autonomous Selection: Pick the #1 Trend
-        topic = trends[0]
-        print(f"\nLocked Target: {topic}")
-
-    print("\n--- 2. DEEP DIVE RESEARCH ---")
-    research = idea_gen.deep_research(topic)
-    print(f"Research Attributes:\n{research[:500]}...") # Show snippet
-    
-    print(f"\n--- 3. VIRAL SCRIPT GENERATION ---")
-    idea = idea_gen.generate_idea(topic, research_context=research)
-    
-    if not idea:
-        print("Failed to generate idea.")
+    batch = args.count > 1 or args.topics_file
+    if batch and args.resume:
+        print("--resume applies to a single run; resume each batch run by its run ID instead.")
         return
 
-    print(f"HOOK: {idea['hook_text']}")
-
-    # 3. Asset Generation (Dynamic Multi-Segment)
-    asset_gen = AssetGenerator()
-    segments_data = [] # List of {audio: path, video: path}
-    
-    print("Generating assets for each script segment...")
-    script_segments = idea.get('script_segments', [])
-    
-    # Fallback if no segments found (e.g. legacy prompt)
-    if not script_segments:
-        script_segments = [{"text": idea['hook_text'], "visual_keyword": "Money"}]
+    if args.topics_file:
+        with open(args.topics_file, 'r') as f:
+            topics = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+        if not topics:
+            print(f"No topics found in {args.topics_file}.")
+            return
+    else:
+        topic = args.topic
+        if not topic and not batch and not args.resume:
+             # Fallback to interactive input if no arg provided
+             topic = input("Enter Trading Topic (or press Enter to auto-detect High Momentum Trend): ")
+        topics = [topic] * max(args.count, 1)
 
-    for idx, seg in enumerate(script_segments):
-        text = seg.get('text', "")
-        keyword = seg.get('visual_keyword', topic)
-        
-        print(f"  [Segment {idx+1}] Keyword: {keyword}")
-        
-        # Audio
-        # Audio (Auto: ElevenLabs or Edge-TTS)
-        audio_path = asset_gen.generate_audio(text)
-            
-        # Video (Pexels)
-        video_path = asset_gen.get_stock_footage(keyword)
-        # Create dummy if mock
-        if "mock" in video_path and not os.path.exists(video_path):
-             with open(video_path, 'wb') as f: f.write(b'\0'*100000)
-             
-        segments_data.append({"audio": audio_path, "video": video_path})
+    ctx = PipelineContext(args)
+    if batch:
+        run_batch(ctx, topics)
+        return
 
-    # 4. Video Editing (Multi-Clip Assembly)
-    editor = VideoEditor()
-    output_video = "final_viral_video.mp4"
-    bg_music = "music.mp3" # User should provide this, or we mock/download
-    if not os.path.exists(bg_music):
-         print("No background music found (skipping).")
-         bg_music = None
-    
-    print("Assembling Hyper-Realistic Video...")
     try:
-        final_video_path = editor.create_multiclip_video(segments_data, output_video, bg_music_path=bg_music)
-    except Exception as e:
-        print(f"Editing failed: {e}")
-        final_video_path = None
+        run = RunManifest(run_id=args.resume)
+    except FileNotFoundError as e:
+        print(f"Cannot resume: {e}")
+        return
+    print(f"Run ID: {run.run_id}{' (resumed)' if run.resumed else ''}")
 
-    if not final_video_path:
-        print("Complex rendering failed. Using simplified backup video.")
-        import shutil
-        if os.path.exists("test_output.mp4"):
-            shutil.copy("test_output.mp4", output_video)
-            final_video_path = output_video
-        else:
-            print("No backup video found.")
+    try:
+        idea, segments_data = prepare_video(ctx, run, topics[0])
+        if not idea or not segments_data:
+            return
+        uploaded_ids = finish_video(ctx, run, idea, segments_data)
+        if uploaded_ids is None:
             return
 
-    # 5. Distribution
-    uploaders = [
-        YouTubeUploader(), 
-        TikTokUploader(), 
-        InstagramUploader(),
-        FacebookUploader()
-    ]
-    
-    uploaded_ids = {}
-    for uploader in uploaders:
-        platform_name = type(uploader).__name__
-        vid_id = uploader.upload(final_video_path, idea['title'], idea['description'])
-        uploaded_ids[platform_name] = vid_id
-
-    # 6. Engagement
-    engager = EngagementManager(uploaders)
-    engager.start_calculated_loop(uploaded_ids, idea['first_comment_question'])
-    
-    # 7. Log
-    feedback.log_upload(idea, uploaded_ids)
-
-    # 8. Mobile Delivery (Fail-safe)
-    send_telegram_video(final_video_path, f"🚀 AI Video Ready: {idea['title']}")
+        # 7. Log
+        run.run_stage("log", lambda: ctx.feedback.log_upload(idea, uploaded_ids) or True)
 
-    print("--- Automation Cycle Complete ---")
+        print(f"--- Automation Cycle Complete (run {run.run_id}) ---")
+    finally:
+        # Written even for failed runs: those are the ones worth looking at
+        record_metrics(ctx, run)
 
 if __name__ == "__main__":
     main()
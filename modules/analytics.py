@@ -1,56 +1,41 @@
-import json
-import os
+from modules.history_store import HistoryService, HistoryStore, DEFAULT_DB_PATH
 
 class FeedbackLoop:
-    def __init__(self, history_file="training_data/video_history.json"):
-        self.history_file = history_file
-        # Ensure dir exists
-        os.makedirs(os.path.dirname(history_file), exist_ok=True)
+    def __init__(self, db_path=DEFAULT_DB_PATH, history: HistoryService = None):
+        self.history = history or HistoryService(HistoryStore(db_path))
         
     def log_upload(self, video_data: dict, platform_ids: dict):
         """
         Log the upload details to tracking file.
         """
-        entry = {
+        self.log_uploads([(video_data, platform_ids)])
+
+    def log_uploads(self, uploads: list):
+        """
+        Log several (video_data, platform_ids) uploads in a single transaction.
+        """
+        self.history.append_many([self._make_entry(video_data, platform_ids) for video_data, platform_ids in uploads])
+        for video_data, _ in uploads:
+            print(f"Logged video to history: {video_data.get('title')}")
+
+    def _make_entry(self, video_data: dict, platform_ids: dict) -> dict:
+        return {
             "title": video_data.get('title'),
             "hook": video_data.get('hook_text'),
             "flash_prompt": video_data.get('flash_prompt_content'),
             "platform_ids": platform_ids,
             "metrics": {"views": 0, "shares": 0, "saves": 0} # Init metrics
         }
-        
-        history = self._load_history()
-        history.append(entry)
-        self._save_history(history)
-        print(f"Logged video to history: {video_data.get('title')}")
 
     def analyze_and_refine(self):
         """
         Analyzes logged videos. Returns insights to improve 'IdeaGenerator'.
         Mock implementation: Returns a string to append to system prompt.
         """
-        history = self._load_history()
-        if not history:
-            return ""
-
         # Mock Logic: Find videos with > 1000 views (simulated)
         # In reality, this would fetch updated stats from APIs first.
-        high_performers = [v for v in history if v['metrics']['views'] > 1000]
+        hooks = self.history.high_performer_hooks(min_views=1000)
         
-        if high_performers:
-            hooks = [v['hook'] for v in high_performers]
+        if hooks:
             return f"Proven viral hooks from history: {hooks}"
         return ""
-
-    def _load_history(self):
-        if os.path.exists(self.history_file):
-            try:
-                with open(self.history_file, 'r') as f:
-                    return json.load(f)
-            except:
-                return []
-        return []
-
-    def _save_history(self, data):
-        with open(self.history_file, 'w') as f:
-            json.dump(data, f, indent=2)
@@ -1,28 +1,79 @@
 import os
+import json
+import threading
 
-# Try importing ElevenLabs, gracefully disable if missing
-try:
-    from elevenlabs import ElevenLabs
-except ImportError:
-    ElevenLabs = None
-    print("Warning: 'elevenlabs' module not found or failed to import. Audio generation will be mocked.")
-    
-import requests
-import random
+from modules import metrics, providers
+from modules.cache import DiskCache, cache_key
+from modules.ffmpeg_renderer import WIDTH, HEIGHT
+from modules.footage_library import FootageLibrary
+from modules.http_client import HTTPClient, get_client
 
-import edge_tts
-import asyncio
+ELEVENLABS_MODEL = "eleven_monolingual_v1"
+EDGE_TTS_VOICE = "en-US-JennyNeural"
+# Edge-TTS returns 24kHz mono MP3 at a constant 48 kbps, so duration = bytes / rate
+EDGE_TTS_BYTES_PER_SECOND = 48000 / 8
+# Pexels does not report file sizes; stock H.264 runs at roughly this many bits per pixel per frame
+PEXELS_BITS_PER_PIXEL = 0.1
+
+
+def estimate_download_bytes(video_file: dict, duration: float) -> int:
+    """Expected size of a Pexels rendition (its reported size when present)."""
+    if video_file.get("size"):
+        return int(video_file["size"])
+    fps = video_file.get("fps") or 30
+    return int((video_file.get("width") or 0) * (video_file.get("height") or 0) * fps * (duration or 10) * PEXELS_BITS_PER_PIXEL / 8)
+
+
+def select_rendition(video_files: list, width: int = WIDTH, height: int = HEIGHT):
+    """
+    Smallest MP4 rendition that fills width x height without upscaling, or the
+    largest one if none does. None if there is no usable file.
+    """
+    files = [f for f in video_files if f.get("width") and f.get("height") and f.get("link")
+             and f.get("file_type", "video/mp4") == "video/mp4"]
+    if not files:
+        return None
+    pixels = lambda f: (f["width"] * f["height"], f.get("fps") or 30)
+    adequate = [f for f in files if f["width"] >= width and f["height"] >= height]
+    return min(adequate, key=pixels) if adequate else max(files, key=pixels)
 
 class AssetGenerator:
-    def __init__(self):
-        self.eleven = None
-        if ElevenLabs and os.getenv("ELEVENLABS_API_KEY"):
+    def __init__(self, http: HTTPClient = None):
+        # TTS SDKs are imported on first use (see `eleven` and generate_audio_batch)
+        self.eleven_key = os.getenv("ELEVENLABS_API_KEY")
+        self._eleven = None
+        
+        # One event loop (on a background thread) runs every Edge-TTS request
+        self._loop = None
+        self._loop_lock = threading.Lock()
+        self._tts_slots = None
+        self.tts_concurrency = int(os.getenv("EDGE_TTS_CONCURRENCY", "4"))
+
+        self.pexels_key = os.getenv("PEXELS_API_KEY")
+        self.pexels_per_page = int(os.getenv("PEXELS_PER_PAGE", "15"))
+        self.max_download_bytes = float(os.getenv("PEXELS_MAX_DOWNLOAD_MB", "40")) * 1024 * 1024
+        self.footage = FootageLibrary()
+        self.http = http or get_client()
+        # Same (engine, voice, model, text) always yields the same audio, so reuse it
+        self.tts_cache = DiskCache(
+            "tts",
+            max_bytes=int(os.getenv("TTS_CACHE_MB", "200")) * 1024 * 1024,
+            max_age_days=float(os.getenv("TTS_CACHE_DAYS", "30"))
+        )
+
+    @property
+    def eleven(self):
+        """ElevenLabs client, or None without a key / the elevenlabs package."""
+        if self._eleven is None and self.eleven_key:
+            ElevenLabs = providers.load("tts", "elevenlabs")
             try:
-                self.eleven = ElevenLabs(api_key=os.getenv("ELEVENLABS_API_KEY"))
+                if ElevenLabs is None:
+                    raise ImportError("'elevenlabs' module not found")
+                self._eleven = ElevenLabs(api_key=self.eleven_key)
             except Exception as e:
                 print(f"Error initializing ElevenLabs: {e}")
-        
-        self.pexels_key = os.getenv("PEXELS_API_KEY")
+                self.eleven_key = None
+        return self._eleven
 
     def generate_audio(self, text: str, voice_id: str = "JBFqnCBsd6RMkjVDRZzb") -> str:
         """
@@ -32,78 +83,199 @@ class AssetGenerator:
             print("ElevenLabs key missing. Using FREE Edge-TTS.")
             return self.generate_audio_free(text)
 
+        key = cache_key("elevenlabs", voice_id, ELEVENLABS_MODEL, text)
+        cached = self.tts_cache.get(key, ".mp3")
+        if cached:
+            print(f"Using cached audio (ElevenLabs) for: {text[:30]}...")
+            metrics.count("tts_cache_hit:elevenlabs")
+            return cached
+
         print(f"Generating audio (ElevenLabs) for: {text[:30]}...")
+        metrics.count("tts:elevenlabs")
         try:
             audio = self.eleven.generate(
                 text=text,
                 voice=voice_id,
-                model="eleven_monolingual_v1"
+                model=ELEVENLABS_MODEL
             )
-            output_path = f"output_audio_{random.randint(1000,9999)}.mp3"
-            with open(output_path, "wb") as f:
-                for chunk in audio:
-                    f.write(chunk)
-            return output_path
+
+            def _write(tmp_path):
+                with open(tmp_path, "wb") as f:
+                    for chunk in audio:
+                        f.write(chunk)
+            return self.tts_cache.put(key, _write, ".mp3")
         except Exception as e:
             print(f"ElevenLabs Error: {e}. Falling back to Free TTS.")
             return self.generate_audio_free(text)
 
-    def generate_audio_free(self, text: str, voice: str = "en-US-JennyNeural") -> str:
+    def generate_audio_free(self, text: str, voice: str = EDGE_TTS_VOICE) -> str:
         """Generates audio using Microsoft Edge TTS (Free)."""
-        output_path = f"output_audio_free_{random.randint(1000,9999)}.mp3"
         # Alternatives: en-US-GuyNeural, en-US-AriaNeural, en-GB-RyanNeural
-        
-        async def _save():
-            communicate = edge_tts.Communicate(text, voice)
-            await communicate.save(output_path)
-            
+        return self.generate_audio_batch([text], voice)[0]["path"]
+
+    def generate_audio_clip(self, text: str) -> dict:
+        """
+        Like generate_audio, but returns {"path", "duration", "words"}. Duration
+        and word timings are known for Edge-TTS; ElevenLabs leaves them None.
+        """
+        if self.eleven:
+            return {"path": self.generate_audio(text), "duration": None, "words": None}
+        return self.generate_audio_batch([text])[0]
+
+    def _tts_event_loop(self):
+        with self._loop_lock:
+            if self._loop is None:
+                import asyncio
+                self._loop = asyncio.new_event_loop()
+                self._tts_slots = asyncio.Semaphore(self.tts_concurrency)
+                threading.Thread(target=self._loop.run_forever, name="edge-tts-loop", daemon=True).start()
+            return self._loop
+
+    def generate_audio_batch(self, texts: list, voice: str = EDGE_TTS_VOICE, as_files: bool = True) -> list:
+        """
+        Synthesizes every text with Edge-TTS concurrently (EDGE_TTS_CONCURRENCY at
+        a time) on one shared event loop. Returns, in order, dicts with:
+          path      cached .mp3 (as_files=True), else None
+          audio     MP3 bytes (as_files=False), else None
+          duration  exact length in seconds, from the CBR byte count
+          words     [{"text", "offset", "duration"}] word timings in seconds
+          cached    True if served from the TTS cache without calling Edge-TTS
+        Failed clips get path "mock_audio.mp3" and duration None.
+        """
+        import asyncio
+        loop = self._tts_event_loop()
+        futures = [asyncio.run_coroutine_threadsafe(self._edge_tts_clip(text, voice, as_files), loop) for text in texts]
+        clips = [f.result() for f in futures]
+        # Counted here: metrics follow the calling thread, not the event loop's
+        for clip in clips:
+            metrics.count("tts_cache_hit:edge_tts" if clip["cached"] else "tts:edge_tts")
+        return clips
+
+    def _edge_tts_cached(self, key: str, voice: str, as_files: bool):
+        """Clip dict for a cached Edge-TTS clip, or None on a cache miss."""
+        cached = self.tts_cache.get(key, ".mp3")
+        if not cached:
+            return None
+        print(f"Using cached FREE audio: {cached} ({voice})")
+        meta_path = self.tts_cache.get(key, ".json")
+        meta = {}
+        if meta_path:
+            with open(meta_path, 'r') as f:
+                meta = json.load(f)
+        duration = meta.get("duration") or os.path.getsize(cached) / EDGE_TTS_BYTES_PER_SECOND
+        audio = None
+        if not as_files:
+            with open(cached, 'rb') as f:
+                audio = f.read()
+        return {"path": cached if as_files else None, "audio": audio, "duration": duration, "words": meta.get("words", []),
+                "cached": True}
+
+    def _edge_tts_store(self, key: str, audio: bytes, duration: float, words: list) -> str:
+        output_path = self.tts_cache.put_bytes(key, audio, ".mp3")
+        self.tts_cache.put_bytes(key, json.dumps({"duration": duration, "words": words}).encode("utf-8"), ".json")
+        return output_path
+
+    async def _edge_tts_clip(self, text: str, voice: str, as_files: bool) -> dict:
+        import asyncio
+        key = cache_key("edge_tts", voice, "edge", text)
+        # Cache lookups and writes (which may evict) touch the disk, so they run
+        # off the shared loop to keep the other syntheses streaming
+        cached = await asyncio.to_thread(self._edge_tts_cached, key, voice, as_files)
+        if cached:
+            return cached
+
+        edge_tts = providers.load("tts", "edge_tts")
         try:
-            asyncio.run(_save())
-            print(f"Generated FREE audio: {output_path} ({voice})")
-            return output_path
+            if edge_tts is None:
+                raise RuntimeError("edge-tts is not installed")
+            audio, words = bytearray(), []
+            async with self._tts_slots:
+                communicate = edge_tts.Communicate(text, voice, boundary="WordBoundary")
+                async for chunk in communicate.stream():
+                    if chunk["type"] == "audio":
+                        audio += chunk["data"]
+                    elif chunk["type"] == "WordBoundary":
+                        # Offsets are in 100ns ticks
+                        words.append({"text": chunk["text"], "offset": chunk["offset"] / 1e7, "duration": chunk["duration"] / 1e7})
+            if not audio:
+                raise RuntimeError("no audio received")
         except Exception as e:
             print(f"EdgeTTS Error: {e}")
-            return "mock_audio.mp3"
+            return {"path": "mock_audio.mp3", "audio": None, "duration": None, "words": [], "cached": False}
+
+        duration = len(audio) / EDGE_TTS_BYTES_PER_SECOND
+        if not as_files:
+            return {"path": None, "audio": bytes(audio), "duration": duration, "words": words, "cached": False}
+        output_path = await asyncio.to_thread(self._edge_tts_store, key, bytes(audio), duration, words)
+        print(f"Generated FREE audio: {output_path} ({voice}, {duration:.1f}s)")
+        return {"path": output_path, "audio": None, "duration": duration, "words": words, "cached": False}
 
-    def get_stock_footage(self, query: str, duration_min: int = 3) -> str:
+    def get_stock_footage(self, query: str, duration_min: float = 3) -> str:
         """
-        Fetches a stock video from Pexels based on the query.
+        Fetches a stock video for the query, from the local footage library when
+        enough clips are cached for this keyword, otherwise from Pexels.
+        duration_min: narration length of the segment; clips at least this long
+        are preferred so they do not visibly loop.
         """
+        if self.footage.has_enough(query):
+            cached = self.footage.pick(query, duration_min)
+            if cached:
+                print(f"Using cached stock footage for: {query} ({cached})")
+                return cached
+
         print(f"Fetching stock footage from Pexels for: {query}")
         
         if not self.pexels_key:
+            cached = self.footage.pick(query, duration_min)
+            if cached:
+                return cached
             print("No PEXELS_API_KEY found. Using mock stock.")
             return "mock_stock.mp4"
             
         try:
             headers = {"Authorization": self.pexels_key}
-            url = f"https://api.pexels.com/videos/search?query={query}&per_page=1&orientation=portrait"
-            response = requests.get(url, headers=headers)
+            params = {"query": query, "per_page": self.pexels_per_page, "orientation": "portrait"}
+            response = self.http.get("https://api.pexels.com/videos/search", headers=headers, params=params)
+            response.raise_for_status()
             data = response.json()
             
             if data['videos']:
-                # Get the first video file url (HD or SD)
-                video_files = data['videos'][0]['video_files']
-                # Prefer HD
-                best_video = next((v for v in video_files if v['width'] == 1080 and v['height'] == 1920), video_files[0])
-                download_url = best_video['link']
-                
-                # Download
-                local_filename = f"stock_{query.replace(' ', '_')}_{random.randint(100,999)}.mp4"
-                print(f"Downloading {local_filename}...")
-                with requests.get(download_url, stream=True) as r:
-                    r.raise_for_status()
-                    with open(local_filename, 'wb') as f:
-                        for chunk in r.iter_content(chunk_size=8192):
-                            f.write(chunk)
-                return local_filename
+                # Prefer clips we don't have yet for this keyword (so videos rotate visuals),
+                # then ones long enough for the narration; Pexels' relevance order breaks ties
+                known = self.footage.known_ids(query)
+                ranked = sorted(data['videos'], key=lambda v: (str(v['id']) in known, (v.get('duration') or 0) < duration_min))
+                for video in ranked:
+                    if self.footage.has_clip(video['id']):
+                        return self.footage.link(query, video['id'])
+
+                    best_video = select_rendition(video['video_files'])
+                    if not best_video:
+                        continue
+                    expected = estimate_download_bytes(best_video, video.get('duration'))
+                    if expected > self.max_download_bytes:
+                        print(f"Skipping Pexels video {video['id']} ({best_video['width']}x{best_video['height']}, "
+                              f"~{expected / (1024*1024):.0f}MB is over the download budget).")
+                        continue
+                    download_url = best_video['link']
+
+                    # Download
+                    print(f"Downloading Pexels video {video['id']} for '{query}' "
+                          f"({best_video['width']}x{best_video['height']}, {video.get('duration')}s, ~{expected / (1024*1024):.1f}MB)...")
+
+                    def _download(tmp_path):
+                        self.http.download(download_url, tmp_path)
+
+                    metadata = {"width": best_video.get('width'), "height": best_video.get('height'), "duration": video.get('duration')}
+                    return self.footage.add(query, video['id'], metadata, _download)
+                print("No Pexels video fits the download budget.")
+                return self.footage.pick(query, duration_min) or "mock_stock.mp4"
             else:
                 print("No videos found on Pexels.")
-                return "mock_stock.mp4"
+                return self.footage.pick(query, duration_min) or "mock_stock.mp4"
 
         except Exception as e:
             print(f"Pexels Error: {e}")
-            return "mock_stock.mp4"
+            return self.footage.pick(query, duration_min) or "mock_stock.mp4"
 
 if __name__ == "__main__":
     from dotenv import load_dotenv
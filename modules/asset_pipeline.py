@@ -0,0 +1,173 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from modules import metrics
+from modules.json_stream import WORDS_PER_SECOND
+
+# Requests per second allowed for each external provider. Pexels allows
+# 200 requests/hour on the free plan, but bursts are fine in short runs.
+DEFAULT_RATE_LIMITS = {
+    "elevenlabs": 2.0,
+    "edge_tts": 5.0,
+    "pexels": 3.0,
+}
+
+
+class RateLimiter:
+    """Thread-safe limiter that spaces out calls to at most `rate` per second."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate and rate > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def acquire(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+def _load_rate_limits() -> dict:
+    """Default limits, overridable with e.g. PEXELS_RATE_LIMIT=1.5 in .env."""
+    limits = dict(DEFAULT_RATE_LIMITS)
+    for provider in limits:
+        value = os.getenv(f"{provider.upper()}_RATE_LIMIT")
+        if value:
+            try:
+                limits[provider] = float(value)
+            except ValueError:
+                print(f"Warning: invalid {provider.upper()}_RATE_LIMIT '{value}'. Using default.")
+    return limits
+
+
+def estimated_duration(seg: dict) -> float:
+    """Narration length of a script segment: the LLM's duration_est, else from the word count."""
+    try:
+        estimate = float(seg.get('duration_est') or 0)
+    except (TypeError, ValueError):
+        estimate = 0
+    return estimate or len(seg.get('text', "").split()) / WORDS_PER_SECOND
+
+
+class AssetPipeline:
+    """
+    Fetches TTS audio and stock footage for every script segment concurrently.
+    Results keep the order of the script so the editor sees the same timeline.
+    """
+
+    def __init__(self, asset_gen, max_workers: int = None, rate_limits: dict = None):
+        self.asset_gen = asset_gen
+        self.max_workers = max_workers or int(os.getenv("ASSET_WORKERS", "4"))
+        limits = rate_limits or _load_rate_limits()
+        self.limiters = {name: RateLimiter(rate) for name, rate in limits.items()}
+
+    def _limit(self, provider: str):
+        limiter = self.limiters.get(provider)
+        if limiter:
+            limiter.acquire()
+
+    def _tts_provider(self) -> str:
+        return "elevenlabs" if self.asset_gen.eleven else "edge_tts"
+
+    def _fetch_audio(self, text: str) -> dict:
+        self._limit(self._tts_provider())
+        # Synthesis calls and cache hits are counted by the asset generator
+        return self.asset_gen.generate_audio_clip(text)
+
+    def _fetch_video(self, keyword: str, duration: float = 3) -> str:
+        self._limit("pexels")
+        video_path = self.asset_gen.get_stock_footage(keyword, duration)
+        # Create dummy if mock
+        if "mock" in video_path and not os.path.exists(video_path):
+            with open(video_path, 'wb') as f:
+                f.write(b'\0' * 100000)
+        return video_path
+
+    def fetch(self, script_segments: list, default_keyword: str = "Money") -> list:
+        """
+        Returns a list of {audio: path, video: path, text, duration, words}, one per
+        segment, in script order. duration / words come from the TTS engine when
+        it reports them (None otherwise), so renders need not probe the audio.
+        """
+        with self.stream(default_keyword) as assets:
+            return assets.results(script_segments)
+
+    def stream(self, default_keyword: str = "Money") -> "AssetStream":
+        """Open stream that accepts segments one at a time, e.g. while the script is generating."""
+        return AssetStream(self, default_keyword)
+
+
+class AssetStream:
+    """
+    Starts audio and footage fetches for each segment as soon as it is
+    submitted. results() matches the final script against the started fetches
+    by (text, keyword), so segments that changed or were never streamed are
+    fetched then, and unused fetches are simply ignored.
+    """
+
+    def __init__(self, pipeline: AssetPipeline, default_keyword: str = "Money"):
+        self.pipeline = pipeline
+        self.default_keyword = default_keyword
+        self.pool = ThreadPoolExecutor(max_workers=pipeline.max_workers)
+        self.jobs = {}  # (text, keyword) -> (audio future, video future)
+        self._lock = threading.Lock()
+        # Fetches are measured under the stage that opened the stream. submit() may
+        # run on another thread (e.g. a streaming LLM callback), so it is captured
+        # here. Without one, fetches are collected and handed to the stage that
+        # calls results().
+        self.stage = metrics.current_stage()
+        self._detached = metrics.Stage("assets") if self.stage is None else None
+
+    def _key(self, seg: dict) -> tuple:
+        return seg.get('text', ""), seg.get('visual_keyword') or self.default_keyword
+
+    def submit(self, seg: dict):
+        key = self._key(seg)
+        with self._lock:
+            if key in self.jobs:
+                return
+            n = len(self.jobs) + 1
+            print(f"  [Segment {n}] Keyword: {key[1]}")
+            parent = self.stage or self._detached
+            self.jobs[key] = (self.pool.submit(metrics.bind(self.pipeline._fetch_audio, f"tts[{n}]", parent), key[0]),
+                              self.pool.submit(metrics.bind(self.pipeline._fetch_video, f"footage[{n}]", parent), key[1],
+                                               estimated_duration(seg)))
+
+    def results(self, script_segments: list) -> list:
+        for seg in script_segments:
+            self.submit(seg)
+        jobs = [self.jobs[self._key(seg)] for seg in script_segments]
+        segments = []
+        for seg, (audio_job, video_job) in zip(script_segments, jobs):
+            clip = audio_job.result()
+            # Renders read the clip's proxy when it is already finished, else the original
+            video = self.pipeline.asset_gen.footage.proxy_for(video_job.result())
+            # Text and word timings drive the captions
+            segments.append({"audio": clip["path"], "video": video, "text": seg.get("text", ""),
+                             "duration": clip.get("duration"), "words": clip.get("words")})
+        self._adopt_fetches()
+        return segments
+
+    def _adopt_fetches(self):
+        current = metrics.current_stage()
+        if self._detached is None or current is None:
+            return
+        for fetch in self._detached.take_children():
+            current.adopt(fetch)
+
+    def close(self):
+        # Fetches for segments that never made it into the script are dropped
+        self.pool.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,115 @@
+import os
+import time
+import uuid
+import hashlib
+import threading
+
+CACHE_ROOT = os.getenv("CACHE_DIR", "cache")
+
+
+def cache_key(*parts) -> str:
+    """Stable content hash for any combination of strings/numbers."""
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(str(part).encode("utf-8"))
+        h.update(b"\x1f")
+    return h.hexdigest()
+
+
+class DiskCache:
+    """
+    Content-addressed file cache with LRU eviction.
+    Entries are plain files named by key; the file mtime is bumped on every hit,
+    so eviction removes the least recently used files first once the cache grows
+    past `max_bytes`, and anything not used for `max_age_days`.
+    """
+
+    def __init__(self, namespace: str, max_bytes: int = 500 * 1024 * 1024, max_age_days: float = 30, root: str = None):
+        self.directory = os.path.join(root or CACHE_ROOT, namespace)
+        self.max_bytes = max_bytes
+        self.max_age = max_age_days * 86400 if max_age_days else None
+        self.stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def path_for(self, key: str, suffix: str = "") -> str:
+        return os.path.join(self.directory, key + suffix)
+
+    def get(self, key: str, suffix: str = ""):
+        """Returns the cached file path, or None on a miss."""
+        path = self.path_for(key, suffix)
+        try:
+            age = time.time() - os.path.getmtime(path)
+            if self.max_age and age > self.max_age:
+                os.remove(path)
+                raise FileNotFoundError(path)
+            os.utime(path, None)  # Mark as recently used
+        except OSError:
+            with self._lock:
+                self.stats["misses"] += 1
+            return None
+        with self._lock:
+            self.stats["hits"] += 1
+        return path
+
+    def put(self, key: str, writer, suffix: str = "") -> str:
+        """
+        Atomically stores a new entry. `writer(tmp_path)` must create the file;
+        it is only moved into place once complete, so readers never see partial files.
+        """
+        path = self.path_for(key, suffix)
+        tmp_path = os.path.join(self.directory, f".tmp-{uuid.uuid4().hex}{suffix}")
+        try:
+            writer(tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        with self._lock:
+            self.stats["writes"] += 1
+        self.evict()
+        return path
+
+    def put_bytes(self, key: str, data: bytes, suffix: str = "") -> str:
+        def _write(tmp_path):
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+        return self.put(key, _write, suffix)
+
+    def evict(self):
+        """Drops expired entries, then least recently used ones until under max_bytes."""
+        entries = []
+        now = time.time()
+        for name in os.listdir(self.directory):
+            if name.startswith(".tmp-"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            if self.max_age and now - st.st_mtime > self.max_age:
+                self._remove(path)
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        if not self.max_bytes or total <= self.max_bytes:
+            return
+        for _, size, path in sorted(entries):
+            self._remove(path)
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def _remove(self, path: str):
+        try:
+            os.remove(path)
+            with self._lock:
+                self.stats["evictions"] += 1
+        except OSError:
+            pass
+
+    def summary(self) -> str:
+        s = self.stats
+        return f"{s['hits']} hits, {s['misses']} misses, {s['writes']} writes, {s['evictions']} evictions"
@@ -0,0 +1,176 @@
+import os
+import re
+import glob
+import textwrap
+import threading
+
+from modules.cache import DiskCache, cache_key
+
+ASSETS_DIR = os.path.join(os.path.dirname(__file__), "..", "assets")
+# Frame the sprites are sized for; other frame sizes scale them proportionally
+FRAME_WIDTH = 1080
+CAPTION_Y = 0.62  # Vertical centre of word captions, as a fraction of frame height
+FLASH_Y = 0.40
+FLASH_DURATION = 0.5
+MOCK_DURATION = 2.5  # Same default the renderers use for mock audio
+
+WORD_COLOR = (255, 255, 255, 255)
+KEYWORD_COLOR = (255, 221, 0, 255)
+STROKE_COLOR = (0, 0, 0, 255)
+FONT_CANDIDATES = ("DejaVuSans-Bold.ttf", "Arial Bold.ttf", "arialbd.ttf", "LiberationSans-Bold.ttf")
+
+
+def caption_word(word: str) -> str:
+    """Uppercased word with surrounding punctuation removed ('$' and '%' are kept)."""
+    return re.sub(r"^[^\w$%]+|[^\w$%]+$", "", word).upper()
+
+
+class CaptionSprites:
+    """
+    Pre-rasterized caption images. Each distinct (word, style) is drawn once
+    with Pillow and stored as a transparent PNG in the 'captions' disk cache;
+    renders only composite these sprites at a position and time window, so no
+    text is rasterized per frame and repeated words cost nothing.
+    """
+
+    def __init__(self, font_path: str = None, font_size: int = None):
+        self.font_path = font_path or os.getenv("CAPTION_FONT") or self._find_font()
+        self.font_size = font_size or int(os.getenv("CAPTION_FONT_SIZE", "110"))
+        self.cache = DiskCache("captions", max_bytes=50 * 1024 * 1024, max_age_days=90)
+        self._paths = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _find_font():
+        bundled = sorted(glob.glob(os.path.join(ASSETS_DIR, "fonts", "*.ttf")))
+        if bundled:
+            return bundled[0]
+        from PIL import ImageFont
+        for name in FONT_CANDIDATES:
+            try:
+                ImageFont.truetype(name, 10)
+                return name
+            except OSError:
+                continue
+        return None
+
+    def _font(self, size: int):
+        from PIL import ImageFont
+        if self.font_path:
+            try:
+                return ImageFont.truetype(self.font_path, size)
+            except OSError:
+                print(f"Warning: caption font '{self.font_path}' not readable. Using Pillow's default font.")
+                self.font_path = None
+        return ImageFont.load_default(size=size)
+
+    def _sprite(self, kind: str, text: str, style, draw_fn) -> str:
+        key = cache_key("caption-v1", kind, text, style, self.font_path, self.font_size)
+        with self._lock:
+            path = self._paths.get(key)
+        if path and os.path.exists(path):
+            return path
+        path = self.cache.get(key, ".png") or self.cache.put(key, lambda tmp: draw_fn().save(tmp, "PNG"), ".png")
+        with self._lock:
+            self._paths[key] = path
+        return path
+
+    def word(self, text: str, highlight: bool = False) -> str:
+        """Path of the sprite for one caption word (yellow when highlighted)."""
+        def _draw():
+            from PIL import Image, ImageDraw
+            size = self.font_size
+            stroke = max(size // 14, 2)
+            font = self._font(size)
+            left, top, right, bottom = font.getbbox(text, stroke_width=stroke)
+            # Long words are shrunk to fit 90% of the frame width
+            if right - left > FRAME_WIDTH * 0.9:
+                size = int(size * FRAME_WIDTH * 0.9 / (right - left))
+                stroke = max(size // 14, 2)
+                font = self._font(size)
+                left, top, right, bottom = font.getbbox(text, stroke_width=stroke)
+            image = Image.new("RGBA", (right - left, bottom - top), (0, 0, 0, 0))
+            ImageDraw.Draw(image).text((-left, -top), text, font=font, fill=KEYWORD_COLOR if highlight else WORD_COLOR,
+                                       stroke_width=stroke, stroke_fill=STROKE_COLOR)
+            return image
+        return self._sprite("word", text, highlight, _draw)
+
+    def flash(self, text: str) -> str:
+        """Path of the flash prompt card: wrapped text on a dark box."""
+        def _draw():
+            from PIL import Image, ImageDraw
+            font = self._font(int(self.font_size * 0.7))
+            body = "\n".join(textwrap.wrap(text, width=18)) or text
+            probe = ImageDraw.Draw(Image.new("RGBA", (1, 1)))
+            # Multiline boxes come back as floats
+            left, top, right, bottom = (round(v) for v in
+                                        probe.multiline_textbbox((0, 0), body, font=font, align="center", spacing=12))
+            pad = 40
+            image = Image.new("RGBA", (right - left + 2 * pad, bottom - top + 2 * pad), (0, 0, 0, 0))
+            draw = ImageDraw.Draw(image)
+            draw.rounded_rectangle((0, 0, image.width - 1, image.height - 1), radius=24,
+                                   fill=(0, 0, 0, 215), outline=KEYWORD_COLOR, width=6)
+            draw.multiline_text((pad - left, pad - top), body, font=font, fill=WORD_COLOR, align="center", spacing=12)
+            return image
+        return self._sprite("flash", text, None, _draw)
+
+
+def _word_timings(seg: dict, duration: float) -> list:
+    """[(word, start, end)] relative to the segment, from TTS word boundaries or spread evenly over the text."""
+    words = seg.get("words")
+    if words:
+        timed = []
+        for i, w in enumerate(words):
+            start = w["offset"]
+            # Hold each word until the next one starts, so captions never flicker off mid-sentence
+            end = words[i + 1]["offset"] if i + 1 < len(words) else start + w["duration"] + 0.3
+            timed.append((w["text"], start, min(end, duration)))
+        return timed
+    tokens = (seg.get("text") or "").split()
+    if not tokens:
+        return []
+    step = duration / len(tokens)
+    return [(token, i * step, (i + 1) * step) for i, token in enumerate(tokens)]
+
+
+def plan_overlays(segments_data: list, durations: list, idea: dict = None, sprites: CaptionSprites = None) -> list:
+    """
+    Per-segment overlay lists [{"image", "start", "end", "y"}] with times
+    relative to the segment start: one sprite per spoken word (caption_keywords
+    highlighted) plus the flash prompt at flash_prompt_time_index for 0.5s.
+    `durations` are the segment lengths as rendered. `y` is the sprite centre
+    as a fraction of frame height; sprites are horizontally centred.
+    """
+    sprites = sprites or CaptionSprites()
+    idea = idea or {}
+    keywords = {caption_word(token).lower() for kw in idea.get("caption_keywords") or [] for token in str(kw).split()}
+    plans = []
+    for seg, duration in zip(segments_data, durations):
+        overlays = []
+        for raw, start, end in _word_timings(seg, duration):
+            word = caption_word(raw)
+            if not word or start >= duration or end <= start:
+                continue
+            overlays.append({"image": sprites.word(word, word.lower() in keywords),
+                             "start": round(start, 3), "end": round(end, 3), "y": CAPTION_Y})
+        plans.append(overlays)
+
+    flash_text = (idea.get("flash_prompt_content") or "").strip()
+    total = sum(durations)
+    if flash_text and total > 0:
+        try:
+            at = float(idea.get("flash_prompt_time_index", 0))
+        except (TypeError, ValueError):
+            at = total / 2
+        at = min(max(at, 0.0), max(total - FLASH_DURATION, 0.0))
+        # Find the segment the flash falls into
+        offset = 0.0
+        for i, duration in enumerate(durations):
+            if at < offset + duration or i == len(durations) - 1:
+                # Overlays are per segment, so keep the whole flash inside this one
+                start = max(min(at - offset, duration - FLASH_DURATION), 0.0)
+                plans[i].append({"image": sprites.flash(flash_text), "start": round(start, 3),
+                                 "end": round(min(start + FLASH_DURATION, duration), 3), "y": FLASH_Y})
+                break
+            offset += duration
+    return plans
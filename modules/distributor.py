@@ -0,0 +1,67 @@
+import os
+import mmap
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from modules import metrics
+
+
+class UploadDistributor:
+    """
+    Uploads one rendered video to every platform concurrently, so distribution
+    takes about as long as the slowest platform instead of the sum. Each file is
+    memory-mapped once and every resumable uploader reads its chunks from that
+    shared mapping; the others get the file path. Uploaders with a `profile`
+    get that profile's encode when one is available.
+    """
+
+    def __init__(self, uploaders: list, max_workers: int = None):
+        self.uploaders = uploaders
+        self.max_workers = max_workers or max(len(uploaders), 1)
+
+    def _upload_one(self, uploader, view, video_path, title, description, state_dir):
+        name = type(uploader).__name__
+        start = time.monotonic()
+        try:
+            if uploader.supports_resumable and view is not None:
+                state_path = os.path.join(state_dir, f"{name}.json") if state_dir else None
+                video_id = uploader.upload_resumable(view, title, description, state_path=state_path)
+            else:
+                video_id = uploader.upload(video_path, title, description)
+        except Exception as e:
+            print(f"[{name}] Upload failed: {e}")
+            return None
+        print(f"[{name}] Upload finished in {time.monotonic() - start:.1f}s.")
+        return video_id
+
+    def distribute(self, video_path: str, title: str, description: str, state_dir: str = None,
+                   profile_paths: dict = None) -> dict:
+        """
+        Returns {platform name: video id (None if that upload failed)}. Upload
+        sessions are kept in `state_dir`, so calling again resumes partial uploads.
+        profile_paths: {profile name: encoded file}; the master is used otherwise.
+        """
+        profile_paths = profile_paths or {}
+        paths = {u: profile_paths.get(u.profile, video_path) for u in self.uploaders}
+        files, maps, views = [], {}, {}
+        try:
+            for path in set(paths.values()):
+                if not os.path.getsize(path):
+                    continue
+                f = open(path, 'rb')
+                files.append(f)
+                maps[path] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                views[path] = memoryview(maps[path])
+
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                jobs = [(type(u).__name__, pool.submit(metrics.bind(self._upload_one, f"upload:{type(u).__name__}"),
+                                                       u, views.get(path), path, title, description, state_dir))
+                        for u, path in paths.items()]
+                return {name: job.result() for name, job in jobs}
+        finally:
+            for view in views.values():
+                view.release()
+            for mm in maps.values():
+                mm.close()
+            for f in files:
+                f.close()
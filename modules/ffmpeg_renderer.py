@@ -0,0 +1,521 @@
+import os
+import re
+import json
+import random
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from modules.cache import DiskCache, cache_key
+
+# Output format shared by every render engine (YouTube Shorts / TikTok / Reels)
+WIDTH, HEIGHT, FPS = 1080, 1920, 24
+# Files below these sizes are the mock placeholders written when an API is missing
+MIN_AUDIO_BYTES = 2000
+MIN_VIDEO_BYTES = 100000
+# Render-ready stock clips made at ingest (see FootageLibrary): already WIDTHxHEIGHT,
+# FPS, silent, watermark crop applied. They sit next to the original clip.
+PROXY_SUFFIX = ".proxy.mp4"
+
+
+def get_ffmpeg_exe() -> str:
+    """Bundled FFmpeg from imageio-ffmpeg, or the system binary."""
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except Exception:
+        return "ffmpeg"
+
+
+def probe_media(path: str) -> dict:
+    """
+    Reads duration / resolution from `ffmpeg -i` output (ffprobe is not bundled
+    with imageio-ffmpeg). Missing values are None.
+    """
+    result = subprocess.run([get_ffmpeg_exe(), "-hide_banner", "-i", path], capture_output=True, text=True)
+    info = {"duration": None, "width": None, "height": None, "has_audio": False}
+    match = re.search(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)", result.stderr)
+    if match:
+        h, m, s = match.groups()
+        info["duration"] = int(h) * 3600 + int(m) * 60 + float(s)
+    match = re.search(r"Stream #.*Video:.*?(\d{2,5})x(\d{2,5})", result.stderr)
+    if match:
+        info["width"], info["height"] = int(match.group(1)), int(match.group(2))
+    info["has_audio"] = bool(re.search(r"Stream #.*Audio:", result.stderr))
+    return info
+
+
+def cover_filter(width: int = WIDTH, height: int = HEIGHT) -> str:
+    """Scale to fill the frame, then center-crop the overflow."""
+    return f"scale={width}:{height}:force_original_aspect_ratio=increase,crop={width}:{height}"
+
+
+def watermark_filter(width: int = WIDTH, height: int = HEIGHT) -> str:
+    """1.1x zoom + center crop, pushing corner watermarks out of frame."""
+    return f"scale=trunc(iw*1.1/2)*2:trunc(ih*1.1/2)*2,crop={width}:{height}"
+
+
+def punch_in_filter(width: int = WIDTH, height: int = HEIGHT) -> str:
+    """Static 80% center crop scaled back up (pattern interrupt)."""
+    return f"crop=iw*0.8:ih*0.8,scale={width}:{height}"
+
+
+def audio_format_filter() -> str:
+    return "aresample=44100,aformat=sample_fmts=fltp:channel_layouts=stereo"
+
+
+def segment_video_filter(duration: float, remove_watermark: bool, punch_in: bool, normalized: bool = False) -> str:
+    """
+    Full per-segment visual chain: cover, watermark crop, punch-in, fixed fps, trim.
+    normalized: the input is a proxy, so scaling, cropping and fps are already done.
+    """
+    chain = []
+    if not normalized:
+        chain.append(cover_filter())
+        if remove_watermark:
+            chain.append(watermark_filter())
+    if punch_in:
+        chain.append(punch_in_filter())
+    if not normalized:
+        chain.append(f"fps={FPS}")
+    chain += ["setsar=1", "format=yuv420p", f"trim=duration={duration:.3f}", "setpts=PTS-STARTPTS"]
+    return ",".join(chain)
+
+
+def segment_audio_filter(duration: float) -> str:
+    """Narration padded with silence / trimmed to exactly the segment duration."""
+    return f"{audio_format_filter()},apad,atrim=duration={duration:.3f},asetpts=PTS-STARTPTS"
+
+
+def is_proxy(path: str) -> bool:
+    return bool(path) and path.endswith(PROXY_SUFFIX)
+
+
+def proxy_source(path: str) -> str:
+    """The original clip a proxy was made from (the proxy itself if that is gone)."""
+    source = path[:-len(PROXY_SUFFIX)] + ".mp4"
+    return source if is_proxy(path) and os.path.exists(source) else path
+
+
+def transcode_proxy(input_path: str, output_path: str, max_seconds: float = 30, preset: str = "veryfast", threads: int = 0,
+                    running: set = None) -> str:
+    """
+    Normalizes a stock clip once into the render format: cover-scaled to
+    WIDTHxHEIGHT with the watermark crop, FPS, no audio, a keyframe every
+    half second (cheap looping and seeking), at most max_seconds long.
+    running: optional set that holds the ffmpeg process while it runs, so the
+    caller can terminate it.
+    """
+    chain = ",".join([cover_filter(), watermark_filter(), f"fps={FPS}", "setsar=1", "format=yuv420p"])
+    cmd = [get_ffmpeg_exe(), "-y", "-hide_banner", "-loglevel", "error",
+           "-t", f"{max_seconds:.3f}", "-i", input_path,
+           "-vf", chain, "-an", "-c:v", "libx264", "-preset", preset, "-crf", "18",
+           "-g", str(FPS // 2), "-bf", "0", "-threads", str(threads), "-movflags", "+faststart", "-f", "mp4",
+           output_path]
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    if running is not None:
+        running.add(process)
+    try:
+        _, stderr = process.communicate()
+    finally:
+        if running is not None:
+            running.discard(process)
+    if process.returncode != 0:
+        raise RuntimeError(f"proxy transcode failed: {stderr.strip()[-800:]}")
+    return output_path
+
+
+def narration_duration(seg: dict) -> float:
+    """Length of a segment's narration: reported by TTS, else probed. None for mock audio."""
+    a_path = seg['audio']
+    if not os.path.exists(a_path) or os.path.getsize(a_path) <= MIN_AUDIO_BYTES:
+        return None
+    # TTS reports exact durations; only probe files that came without one
+    return seg.get("duration") or probe_media(a_path).get("duration")
+
+
+def overlay_chain(video_label: str, overlays: list, first_input: int, tag: str):
+    """
+    Composites pre-rendered sprites (see modules.captions) onto `video_label`,
+    each horizontally centred and enabled only in its [start, end] window.
+    Every distinct image is one input, split when it is used more than once.
+    Returns (input args, filter strings, output label).
+    """
+    if not overlays:
+        return [], [], video_label
+    images = list(dict.fromkeys(o["image"] for o in overlays))
+    inputs, filters, sources = [], [], {}
+    for n, image in enumerate(images):
+        inputs += ["-i", image]
+        uses = sum(1 for o in overlays if o["image"] == image)
+        if uses == 1:
+            sources[image] = [f"[{first_input + n}:v]"]
+        else:
+            sources[image] = [f"[{tag}s{n}_{k}]" for k in range(uses)]
+            filters.append(f"[{first_input + n}:v]split={uses}{''.join(sources[image])}")
+    current = video_label
+    for k, o in enumerate(overlays):
+        out = f"[{tag}o{k}]"
+        filters.append(f"{current}{sources[o['image']].pop(0)}overlay=x=(W-w)/2:y=H*{o['y']}-h/2:"
+                       f"enable='between(t,{o['start']:.3f},{o['end']:.3f})'{out}")
+        current = out
+    return inputs, filters, current
+
+
+class FFmpegRenderer:
+    """
+    Renders the same timeline as VideoEditor's MoviePy path, but compiles it into
+    a single filter_complex graph run by one ffmpeg process, so no frame ever
+    passes through Python.
+    """
+
+    def __init__(self, preset: str = "ultrafast", threads: int = 0):
+        self.ffmpeg = get_ffmpeg_exe()
+        self.preset = preset
+        self.threads = threads
+
+    @staticmethod
+    def _normalized(seg: dict) -> bool:
+        """True if the segment's clip is a proxy (and not a mock placeholder, which gets the fallback image)."""
+        return is_proxy(seg['video']) and os.path.getsize(seg['video']) > MIN_VIDEO_BYTES
+
+    def _segment_inputs(self, seg: dict, fallback_image: str):
+        """Returns (duration, audio input args, video input args)."""
+        a_path, v_path = seg['audio'], seg['video']
+
+        duration = narration_duration(seg)
+        if duration:
+            audio_args = ["-i", a_path]
+        else:
+            duration = 2.5  # Default mock duration
+            audio_args = ["-f", "lavfi", "-t", f"{duration:.3f}", "-i", "anullsrc=r=44100:cl=stereo"]
+
+        if os.path.getsize(v_path) > MIN_VIDEO_BYTES:
+            # Loop the stock clip to cover the narration
+            return duration, audio_args, ["-stream_loop", "-1", "-t", f"{duration:.3f}", "-i", v_path]
+        if fallback_image and os.path.exists(fallback_image):
+            return duration, audio_args, ["-loop", "1", "-framerate", str(FPS), "-t", f"{duration:.3f}", "-i", fallback_image]
+        color = f"color=c=black:s={WIDTH}x{HEIGHT}:r={FPS}"
+        return duration, audio_args, ["-f", "lavfi", "-t", f"{duration:.3f}", "-i", color]
+
+    def build_command(self, segments_data: list, output_path: str, music_path: str = None,
+                      disclaimer_path: str = None, remove_watermark: bool = True, fallback_image: str = None) -> list:
+        """Compiles the segment list into one ffmpeg invocation. Returns None if no segment is usable."""
+        inputs, filters, concat_pads = [], [], []
+        n_inputs = 0
+
+        for seg in segments_data:
+            if not os.path.exists(seg['audio']) or not os.path.exists(seg['video']):
+                print(f"Skipping segment due to missing files: {seg['audio']}, {seg['video']}")
+                continue
+
+            duration, audio_args, video_args = self._segment_inputs(seg, fallback_image)
+            v_idx, a_idx = n_inputs, n_inputs + 1
+            inputs += video_args + audio_args
+            n_inputs += 2
+
+            i = len(concat_pads)
+            chain = segment_video_filter(duration, remove_watermark, random.random() > 0.5, self._normalized(seg))
+            filters.append(f"[{v_idx}:v]{chain}[v{i}]")
+            filters.append(f"[{a_idx}:a]{segment_audio_filter(duration)}[a{i}]")
+            # Captions are timed relative to the segment, so they go on before concat
+            overlay_inputs, overlay_filters, v_label = overlay_chain(f"[v{i}]", seg.get("overlays"), n_inputs, f"c{i}")
+            inputs += overlay_inputs
+            filters += overlay_filters
+            n_inputs += len(overlay_inputs) // 2
+            concat_pads.append(f"{v_label}[a{i}]")
+
+        if not concat_pads:
+            return None
+
+        filters.append(f"{''.join(concat_pads)}concat=n={len(concat_pads)}:v=1:a=1[vcat][acat]")
+        video_out, audio_out = "[vcat]", "[acat]"
+
+        if music_path:
+            inputs += ["-stream_loop", "-1", "-i", music_path]
+            filters.append(f"[{n_inputs}:a]{audio_format_filter()},volume=0.10[music]")  # 10% volume
+            filters.append(f"{audio_out}[music]amix=inputs=2:duration=first:normalize=0[aout]")
+            audio_out = "[aout]"
+            n_inputs += 1
+
+        if disclaimer_path:
+            inputs += ["-i", disclaimer_path]
+            filters.append(f"[{n_inputs}:v]scale={int(WIDTH * 0.9)}:-2[disc]")
+            filters.append(f"{video_out}[disc]overlay=(W-w)/2:H-h-50[vout]")
+            video_out = "[vout]"
+            n_inputs += 1
+
+        return [
+            self.ffmpeg, "-y", "-hide_banner", "-loglevel", "error",
+            *inputs,
+            "-filter_complex", ";".join(filters),
+            "-map", video_out, "-map", audio_out,
+            "-c:v", "libx264", "-preset", self.preset, "-r", str(FPS), "-pix_fmt", "yuv420p",
+            "-c:a", "aac", "-b:a", "192k",
+            "-threads", str(self.threads), "-movflags", "+faststart",
+            output_path
+        ]
+
+    def render(self, segments_data: list, output_path: str, music_path: str = None,
+               disclaimer_path: str = None, remove_watermark: bool = True, fallback_image: str = None) -> str:
+        cmd = self.build_command(segments_data, output_path, music_path, disclaimer_path, remove_watermark, fallback_image)
+        if not cmd:
+            print("No clips created.")
+            return None
+        print(f"Starting render (FFmpeg, {len(segments_data)} segments)...")
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"ffmpeg exited with {result.returncode}: {result.stderr.strip()[-800:]}")
+        return output_path
+
+
+def file_fingerprint(path: str) -> str:
+    """Cheap identity for cache keys: path + size + mtime (no need to hash large clips)."""
+    if not path or not os.path.exists(path):
+        return "none"
+    st = os.stat(path)
+    return f"{os.path.abspath(path)}:{st.st_size}:{st.st_mtime_ns}"
+
+
+class ParallelSegmentRenderer(FFmpegRenderer):
+    """
+    Renders every segment to a normalized intermediate (1080x1920, 24fps, AAC)
+    in parallel, then joins them with the concat demuxer without re-encoding.
+    Intermediates are cached by a hash of their inputs and transform parameters,
+    so a re-run only re-renders segments that changed.
+    """
+
+    def __init__(self, preset: str = "ultrafast", threads: int = 0, workers: int = None):
+        super().__init__(preset=preset, threads=threads)
+        self.workers = workers or os.cpu_count() or 1
+        self.cache = DiskCache("segments", max_bytes=int(os.getenv("SEGMENT_CACHE_MB", "2048")) * 1024 * 1024, max_age_days=7)
+
+    def _segment_key(self, seg: dict, remove_watermark: bool, disclaimer_path: str, fallback_image: str) -> str:
+        return cache_key(
+            "segment-v1", WIDTH, HEIGHT, FPS, self.preset, remove_watermark,
+            file_fingerprint(seg['audio']), file_fingerprint(seg['video']),
+            file_fingerprint(disclaimer_path), file_fingerprint(fallback_image),
+            # Sprite paths are content-addressed, so the plan identifies the captions
+            json.dumps(seg.get("overlays") or [], sort_keys=True)
+        )
+
+    def render_segment(self, seg: dict, remove_watermark: bool = True, disclaimer_path: str = None, fallback_image: str = None) -> str:
+        """Returns the path of the normalized intermediate for one segment."""
+        key = self._segment_key(seg, remove_watermark, disclaimer_path, fallback_image)
+        cached = self.cache.get(key, ".mp4")
+        if cached:
+            return cached
+
+        duration, audio_args, video_args = self._segment_inputs(seg, fallback_image)
+        # Seeded by the inputs so a re-run makes the same choice and hits the cache
+        punch_in = random.Random(key).random() > 0.5
+        filters = [
+            f"[0:v]{segment_video_filter(duration, remove_watermark, punch_in, self._normalized(seg))}[v]",
+            f"[1:a]{segment_audio_filter(duration)}[a]",
+        ]
+        inputs = video_args + audio_args
+        overlay_inputs, overlay_filters, video_out = overlay_chain("[v]", seg.get("overlays"), 2, "c")
+        inputs += overlay_inputs
+        filters += overlay_filters
+        if disclaimer_path:
+            # Burned into every segment so the joined video needs no further compositing
+            disc_idx = 2 + len(overlay_inputs) // 2
+            inputs += ["-i", disclaimer_path]
+            filters.append(f"[{disc_idx}:v]scale={int(WIDTH * 0.9)}:-2[disc]")
+            filters.append(f"{video_out}[disc]overlay=(W-w)/2:H-h-50[vout]")
+            video_out = "[vout]"
+
+        # Each worker gets its share of the cores
+        threads = self.threads or max(1, (os.cpu_count() or 1) // self.workers)
+
+        def _write(tmp_path):
+            cmd = [
+                self.ffmpeg, "-y", "-hide_banner", "-loglevel", "error",
+                *inputs,
+                "-filter_complex", ";".join(filters),
+                "-map", video_out, "-map", "[a]",
+                "-c:v", "libx264", "-preset", self.preset, "-r", str(FPS), "-pix_fmt", "yuv420p",
+                "-c:a", "aac", "-b:a", "192k", "-ar", "44100", "-ac", "2",
+                "-threads", str(threads), "-f", "mp4",
+                tmp_path
+            ]
+            result = subprocess.run(cmd, capture_output=True, text=True)
+            if result.returncode != 0:
+                raise RuntimeError(f"segment render failed: {result.stderr.strip()[-800:]}")
+        return self.cache.put(key, _write, ".mp4")
+
+    def render(self, segments_data: list, output_path: str, music_path: str = None,
+               disclaimer_path: str = None, remove_watermark: bool = True, fallback_image: str = None) -> str:
+        usable = []
+        for seg in segments_data:
+            if not os.path.exists(seg['audio']) or not os.path.exists(seg['video']):
+                print(f"Skipping segment due to missing files: {seg['audio']}, {seg['video']}")
+                continue
+            usable.append(seg)
+        if not usable:
+            print("No clips created.")
+            return None
+
+        print(f"Pre-rendering {len(usable)} segments on {self.workers} workers...")
+        # Threads are enough here: the heavy lifting happens in the ffmpeg child processes
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            parts = list(pool.map(lambda seg: self.render_segment(seg, remove_watermark, disclaimer_path, fallback_image), usable))
+        print(f"Segment cache: {self.cache.summary()}")
+
+        list_path = f"{output_path}.concat.txt"
+        joined_path = f"{output_path}.joined.mp4" if music_path else output_path
+        with open(list_path, 'w') as f:
+            for part in parts:
+                f.write(f"file '{os.path.abspath(part)}'\n")
+        try:
+            cmd = [self.ffmpeg, "-y", "-hide_banner", "-loglevel", "error",
+                   "-f", "concat", "-safe", "0", "-i", list_path,
+                   "-c", "copy", "-movflags", "+faststart", joined_path]
+            result = subprocess.run(cmd, capture_output=True, text=True)
+            if result.returncode != 0:
+                raise RuntimeError(f"concat failed: {result.stderr.strip()[-800:]}")
+
+            if music_path:
+                # Only the audio track is re-encoded; video is stream-copied
+                cmd = [self.ffmpeg, "-y", "-hide_banner", "-loglevel", "error",
+                       "-i", joined_path, "-stream_loop", "-1", "-i", music_path,
+                       "-filter_complex", f"[1:a]{audio_format_filter()},volume=0.10[music];[0:a][music]amix=inputs=2:duration=first:normalize=0[aout]",
+                       "-map", "0:v", "-map", "[aout]", "-c:v", "copy", "-c:a", "aac", "-b:a", "192k",
+                       "-movflags", "+faststart", output_path]
+                result = subprocess.run(cmd, capture_output=True, text=True)
+                if result.returncode != 0:
+                    raise RuntimeError(f"music mix failed: {result.stderr.strip()[-800:]}")
+        finally:
+            for tmp in (list_path, joined_path if music_path else None):
+                if tmp and os.path.exists(tmp):
+                    os.remove(tmp)
+        return output_path
+
+
+# Per-platform output profiles, encoded from the rendered master. Quality
+# profiles use CRF capped by maxrate. Size-capped ones also use CRF, with the
+# maxrate that would just fill max_mb for the duration, so max_mb is a ceiling
+# and short or simple videos stay small.
+OUTPUT_PROFILES = {
+    "youtube": {"crf": 18, "maxrate": "12M", "bufsize": "24M", "audio_bitrate": "192k"},
+    "tiktok": {"crf": 21, "maxrate": "8M", "bufsize": "16M", "audio_bitrate": "128k"},
+    "instagram": {"crf": 22, "maxrate": "5M", "bufsize": "10M", "audio_bitrate": "128k"},
+    "facebook": {"crf": 22, "maxrate": "5M", "bufsize": "10M", "audio_bitrate": "128k"},
+    "telegram": {"crf": 23, "max_mb": 45, "audio_bitrate": "96k"},
+}
+
+
+def _kbps(rate: str) -> float:
+    return float(rate.rstrip("kK")) if rate.lower().endswith("k") else float(rate.rstrip("mM")) * 1000
+
+
+def target_video_kbps(max_mb: float, duration: float, audio_bitrate: str, headroom: float = 0.95) -> int:
+    """Video bitrate that keeps video + audio under max_mb for this duration (mp4 overhead included in headroom)."""
+    total_kbps = max_mb * 8 * 1024 * 1024 / 1000 / max(duration, 1.0)
+    return max(int(total_kbps * headroom - _kbps(audio_bitrate)), 200)
+
+
+def profile_video_args(profile: dict, duration: float) -> list:
+    if profile.get("max_mb"):
+        kbps = target_video_kbps(profile["max_mb"], duration, profile["audio_bitrate"])
+        return ["-crf", str(profile["crf"]), "-maxrate", f"{kbps}k", "-bufsize", f"{kbps * 2}k"]
+    return ["-crf", str(profile["crf"]), "-maxrate", profile["maxrate"], "-bufsize", profile["bufsize"]]
+
+
+def encode_profiles(master_path: str, outputs: dict, preset: str = "veryfast", threads: int = 0) -> dict:
+    """
+    Encodes the master into every requested profile with one ffmpeg process:
+    the master is decoded once and the frames are fed to one encoder per output.
+    outputs: {profile name: output path}. Returns {profile name: file to use}:
+    profiles with identical settings share the first one's file, and size-capped
+    profiles the master already fits get the master itself.
+    """
+    if not outputs:
+        return {}
+    master_size = os.path.getsize(master_path)
+    files, encodes = {}, {}  # encodes: settings -> (profile name, path)
+    for name, path in outputs.items():
+        profile = OUTPUT_PROFILES[name]
+        if profile.get("max_mb") and master_size <= profile["max_mb"] * 1024 * 1024:
+            files[name] = master_path
+            continue
+        settings = json.dumps(profile, sort_keys=True)
+        encodes.setdefault(settings, (name, path))
+        files[name] = encodes[settings][1]
+    if not encodes:
+        return files
+
+    duration = probe_media(master_path).get("duration") or 60.0
+    cmd = [get_ffmpeg_exe(), "-y", "-hide_banner", "-loglevel", "error", "-i", master_path]
+    for name, path in encodes.values():
+        profile = OUTPUT_PROFILES[name]
+        cmd += ["-map", "0:v", "-map", "0:a?",
+                "-c:v", "libx264", "-preset", preset, *profile_video_args(profile, duration),
+                "-pix_fmt", "yuv420p", "-c:a", "aac", "-b:a", profile["audio_bitrate"],
+                "-threads", str(threads), "-movflags", "+faststart", path]
+    print(f"Encoding profiles {', '.join(name for name, _ in encodes.values())} in one pass...")
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"profile encode failed: {result.stderr.strip()[-800:]}")
+
+    # The maxrate cap is enforced over the buffer, so it can still overshoot; redo those outputs
+    for name, path in encodes.values():
+        max_mb = OUTPUT_PROFILES[name].get("max_mb")
+        if max_mb and os.path.getsize(path) > max_mb * 1024 * 1024:
+            print(f"Profile '{name}' is {os.path.getsize(path) / (1024*1024):.1f}MB. Re-encoding to fit {max_mb}MB...")
+            encode_to_size(master_path, path, max_mb, OUTPUT_PROFILES[name]["audio_bitrate"], preset=preset, threads=threads)
+    return files
+
+
+def encode_to_size(input_path: str, output_path: str, max_mb: float, audio_bitrate: str = "96k",
+                   preset: str = "veryfast", threads: int = 0, attempts: int = 3) -> str:
+    """
+    Two-pass target-bitrate encode sized to fit max_mb. The bitrate comes from
+    the duration and the budget minus audio; if the result still overshoots,
+    the bitrate is scaled down by the overshoot and the encode repeated.
+    """
+    ffmpeg = get_ffmpeg_exe()
+    duration = probe_media(input_path).get("duration") or 60.0
+    budget = max_mb * 1024 * 1024
+    kbps = target_video_kbps(max_mb, duration, audio_bitrate)
+    passlog = f"{output_path}.passlog"
+    try:
+        for attempt in range(attempts):
+            common = ["-c:v", "libx264", "-preset", preset, "-b:v", f"{kbps}k", "-pix_fmt", "yuv420p",
+                      "-threads", str(threads), "-passlogfile", passlog]
+            first = [ffmpeg, "-y", "-hide_banner", "-loglevel", "error", "-i", input_path,
+                     *common, "-pass", "1", "-an", "-f", "mp4", os.devnull]
+            second = [ffmpeg, "-y", "-hide_banner", "-loglevel", "error", "-i", input_path,
+                      *common, "-pass", "2", "-c:a", "aac", "-b:a", audio_bitrate,
+                      "-movflags", "+faststart", output_path]
+            for cmd in (first, second):
+                result = subprocess.run(cmd, capture_output=True, text=True)
+                if result.returncode != 0:
+                    raise RuntimeError(f"size-targeted encode failed: {result.stderr.strip()[-800:]}")
+            size = os.path.getsize(output_path)
+            if size <= budget:
+                return output_path
+            kbps = max(int(kbps * budget / size * 0.97), 100)
+            print(f"Encode is {size / (1024*1024):.1f}MB, over {max_mb}MB. Retrying at {kbps}kbps...")
+        raise RuntimeError(f"could not fit {input_path} into {max_mb}MB")
+    finally:
+        for leftover in (f"{passlog}-0.log", f"{passlog}-0.log.mbtree"):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+
+
+def size_capped_copy(master_path: str, max_mb: float, audio_bitrate: str = "96k", suffix: str = "telegram") -> str:
+    """
+    Returns a version of the master that fits max_mb: the master itself if it
+    already fits, else <master>_<suffix>.mp4, encoded once and reused while it
+    is newer than the master and within budget.
+    """
+    budget = max_mb * 1024 * 1024
+    if os.path.getsize(master_path) <= budget:
+        return master_path
+    base, ext = os.path.splitext(master_path)
+    capped = f"{base}_{suffix}{ext}"
+    if os.path.exists(capped) and os.path.getsize(capped) <= budget \
+            and os.path.getmtime(capped) >= os.path.getmtime(master_path):
+        print(f"Using cached {max_mb}MB encode: {capped}")
+        return capped
+    return encode_to_size(master_path, capped, max_mb, audio_bitrate)
@@ -0,0 +1,299 @@
+import os
+import json
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from modules.cache import CACHE_ROOT
+from modules.ffmpeg_renderer import PROXY_SUFFIX, transcode_proxy
+
+
+class FootageLibrary:
+    """
+    Persistent store of downloaded stock clips.
+    Each clip is stored once (by Pexels video id) and indexed by every normalized
+    keyword it was fetched for, together with its resolution/duration/orientation.
+    Repeat keywords are served from disk, rotating through the cached clips.
+
+    Every clip also gets a render-ready proxy (1080x1920, 24fps, silent,
+    watermark crop applied), transcoded once in the background when the clip
+    enters the library, so renders that reuse it skip the scaling work.
+    """
+
+    def __init__(self, directory: str = None, max_bytes: int = None, clips_per_keyword: int = None, proxies: bool = None):
+        self.directory = directory or os.path.join(CACHE_ROOT, "footage")
+        self.max_bytes = max_bytes or int(os.getenv("FOOTAGE_LIBRARY_MB", "2048")) * 1024 * 1024
+        self.clips_per_keyword = clips_per_keyword or int(os.getenv("FOOTAGE_CLIPS_PER_KEYWORD", "3"))
+        self.index_path = os.path.join(self.directory, "index.json")
+        self._lock = threading.RLock()
+        os.makedirs(self.directory, exist_ok=True)
+        self.index = self._load_index()
+
+        # Proxies only pay off when the library outlives the run, which it does not on CI
+        workers = int(os.getenv("PROXY_WORKERS", "2"))
+        default = "0" if os.getenv("CI") or workers < 1 else "1"
+        self.proxies = proxies if proxies is not None else os.getenv("FOOTAGE_PROXIES", default) != "0"
+        self.proxy_preset = os.getenv("PROXY_PRESET", "veryfast")
+        self.proxy_max_seconds = float(os.getenv("PROXY_MAX_SECONDS", "30"))
+        self._proxy_pool = ThreadPoolExecutor(max_workers=max(workers, 1))
+        self._pending = {}  # video id -> future of a running proxy transcode
+        self._transcodes = set()  # ffmpeg processes of running transcodes
+        self._in_use = set()  # ids of clips handed out by this process; never evicted while it runs
+        self._uncached = []  # clips too large for the library, removed at exit
+        self._closing = False
+        # Pool workers are joined before atexit handlers run, so pending transcodes
+        # are stopped from a threading exit hook instead
+        if hasattr(threading, "_register_atexit"):
+            threading._register_atexit(self._drop_queued_proxies)
+        self._remove_stale_tmp()
+
+    def _drop_queued_proxies(self):
+        """
+        Cancels queued transcodes and stops running ones at exit, so the process
+        never waits on proxies; their partial files are removed by _make_proxy.
+        """
+        self._closing = True
+        self._proxy_pool.shutdown(wait=False, cancel_futures=True)
+        for process in list(self._transcodes):
+            try:
+                process.terminate()
+            except OSError:
+                pass
+        for path in self._uncached:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _remove_stale_tmp(self, max_age_s: float = 3600):
+        """Deletes partial downloads, proxies and uncached clips left behind by a killed run."""
+        now = time.time()
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if name.startswith((".tmp-", ".uncached-")) and now - os.path.getmtime(path) > max_age_s:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    @staticmethod
+    def normalize_keyword(keyword: str) -> str:
+        return " ".join(keyword.lower().split())
+
+    def _load_index(self) -> dict:
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, 'r') as f:
+                    return json.load(f)
+            except Exception as e:
+                print(f"Warning: footage index unreadable ({e}). Rebuilding.")
+        return {"clips": {}, "keywords": {}}
+
+    def _save_index(self):
+        tmp_path = f"{self.index_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.index, f, indent=2)
+        os.replace(tmp_path, self.index_path)
+
+    def _clip_path(self, clip: dict) -> str:
+        return os.path.join(self.directory, clip["file"])
+
+    def _proxy_path(self, clip: dict):
+        """Path of the clip's finished proxy, or None."""
+        if not clip.get("proxy"):
+            return None
+        path = os.path.join(self.directory, clip["proxy"])
+        return path if os.path.exists(path) else None
+
+    def _id_for_file(self, file_name: str):
+        with self._lock:
+            return next((i for i, c in self.index["clips"].items() if c["file"] == file_name), None)
+
+    def clips_for(self, keyword: str) -> list:
+        """All cached clips for this keyword that still exist on disk."""
+        with self._lock:
+            ids = self.index["keywords"].get(self.normalize_keyword(keyword), [])
+            clips = [self.index["clips"][i] for i in ids if i in self.index["clips"]]
+            return [c for c in clips if os.path.exists(self._clip_path(c))]
+
+    def known_ids(self, keyword: str) -> set:
+        with self._lock:
+            return set(self.index["keywords"].get(self.normalize_keyword(keyword), []))
+
+    def has_enough(self, keyword: str) -> bool:
+        return len(self.clips_for(keyword)) >= self.clips_per_keyword
+
+    def has_clip(self, video_id) -> bool:
+        with self._lock:
+            clip = self.index["clips"].get(str(video_id))
+            return bool(clip) and os.path.exists(self._clip_path(clip))
+
+    def pick(self, keyword: str, min_duration: float = None):
+        """
+        Returns the least recently used clip for this keyword (rotation), or None.
+        Clips at least min_duration long are preferred, so short ones don't loop.
+        """
+        with self._lock:
+            clips = self.clips_for(keyword)
+            if not clips:
+                return None
+            if min_duration:
+                clips = [c for c in clips if (c.get("duration") or 0) >= min_duration] or clips
+            clip = min(clips, key=lambda c: c.get("last_used", 0))
+            clip["last_used"] = time.time()
+            self._save_index()
+            video_id = self._id_for_file(clip["file"])
+            self._in_use.add(video_id)
+            self.ensure_proxy(video_id)
+            return self._clip_path(clip)
+
+    def link(self, keyword: str, video_id) -> str:
+        """Indexes an already cached clip under another keyword and returns its path."""
+        with self._lock:
+            video_id = str(video_id)
+            ids = self.index["keywords"].setdefault(self.normalize_keyword(keyword), [])
+            if video_id not in ids:
+                ids.append(video_id)
+            clip = self.index["clips"][video_id]
+            clip["last_used"] = time.time()
+            self._save_index()
+            self._in_use.add(video_id)
+            self.ensure_proxy(video_id)
+            return self._clip_path(clip)
+
+    def add(self, keyword: str, video_id, metadata: dict, writer) -> str:
+        """
+        Stores a new clip. `writer(tmp_path)` downloads the file; it is moved into
+        the library only once complete. metadata: width, height, duration.
+        A clip larger than the whole quota is not cached: its path is only valid
+        for this run.
+        """
+        video_id = str(video_id)
+        file_name = f"pexels_{video_id}.mp4"
+        tmp_path = os.path.join(self.directory, f".tmp-{uuid.uuid4().hex}.mp4")
+        try:
+            writer(tmp_path)
+            if os.path.getsize(tmp_path) > self.max_bytes:
+                print(f"Stock clip {video_id} is larger than the footage library quota. Using it without caching.")
+                path = os.path.join(self.directory, f".uncached-{uuid.uuid4().hex}.mp4")
+                os.replace(tmp_path, path)
+                self._uncached.append(path)
+                return path
+            os.replace(tmp_path, os.path.join(self.directory, file_name))
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        width, height = metadata.get("width") or 0, metadata.get("height") or 0
+        with self._lock:
+            self.index["clips"][video_id] = {
+                "file": file_name,
+                "width": width,
+                "height": height,
+                "duration": metadata.get("duration"),
+                "orientation": "portrait" if height > width else "landscape" if width > height else "square",
+                "size": os.path.getsize(os.path.join(self.directory, file_name)),
+                "added": time.time(),
+                "last_used": time.time(),
+            }
+            # link() also queues the proxy transcode
+            path = self.link(keyword, video_id)
+            self.evict()
+            return path
+
+    def ensure_proxy(self, video_id):
+        """Starts the background proxy transcode for a clip unless it exists or is running. Returns its future or None."""
+        if not self.proxies:
+            return None
+        video_id = str(video_id)
+        with self._lock:
+            clip = self.index["clips"].get(video_id)
+            if not clip or self._proxy_path(clip):
+                return None
+            future = self._pending.get(video_id)
+            if future is None:
+                if self._closing:
+                    return None
+                future = self._pending[video_id] = self._proxy_pool.submit(self._make_proxy, video_id)
+            return future
+
+    def _make_proxy(self, video_id: str):
+        with self._lock:
+            clip = dict(self.index["clips"].get(video_id) or {})
+        try:
+            if not clip or not os.path.exists(self._clip_path(clip)):
+                return None
+            file_name = f"pexels_{video_id}{PROXY_SUFFIX}"
+            tmp_path = os.path.join(self.directory, f".tmp-{uuid.uuid4().hex}.mp4")
+            try:
+                transcode_proxy(self._clip_path(clip), tmp_path, self.proxy_max_seconds, self.proxy_preset,
+                                running=self._transcodes)
+                os.replace(tmp_path, os.path.join(self.directory, file_name))
+            except Exception as e:
+                if not self._closing:
+                    print(f"Warning: could not make proxy for stock clip {video_id} ({e}). Renders will use the original.")
+                return None
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+            with self._lock:
+                entry = self.index["clips"].get(video_id)
+                if entry is None:  # Evicted meanwhile
+                    os.remove(os.path.join(self.directory, file_name))
+                    return None
+                entry["proxy"] = file_name
+                entry["proxy_size"] = os.path.getsize(os.path.join(self.directory, file_name))
+                self._save_index()
+                self.evict()
+            return os.path.join(self.directory, file_name)
+        finally:
+            with self._lock:
+                self._pending.pop(video_id, None)
+
+    def proxy_for(self, path: str) -> str:
+        """
+        The finished proxy of a library clip, else `path` unchanged. Never waits:
+        a clip whose proxy is still transcoding is used as is this time, and the
+        transcode keeps running (started here if needed) for later renders.
+        """
+        video_id = self._id_for_file(os.path.basename(path or ""))
+        if video_id is None:
+            return path
+        self.ensure_proxy(video_id)
+        with self._lock:
+            clip = self.index["clips"].get(video_id)
+            return (clip and self._proxy_path(clip)) or path
+
+    def evict(self):
+        """
+        Removes least recently used clips until the library fits its disk quota.
+        Clips this process handed out or is transcoding are kept, so the library
+        may stay over quota until a later run.
+        """
+        with self._lock:
+            clips = self.index["clips"]
+            total = sum(c.get("size", 0) + c.get("proxy_size", 0) for c in clips.values())
+            if total <= self.max_bytes:
+                return
+            pinned = self._in_use | set(self._pending)
+            for video_id, clip in sorted(clips.items(), key=lambda kv: kv[1].get("last_used", 0)):
+                if video_id in pinned:
+                    continue
+                for file_name in (clip["file"], clip.get("proxy")):
+                    try:
+                        if file_name:
+                            os.remove(os.path.join(self.directory, file_name))
+                    except OSError:
+                        pass
+                total -= clip.get("size", 0) + clip.get("proxy_size", 0)
+                del clips[video_id]
+                for ids in self.index["keywords"].values():
+                    if video_id in ids:
+                        ids.remove(video_id)
+                print(f"Evicted stock clip {clip['file']} from footage library.")
+                if total <= self.max_bytes:
+                    break
+            self.index["keywords"] = {k: v for k, v in self.index["keywords"].items() if v}
+            self._save_index()
@@ -0,0 +1,326 @@
+import os
+import json
+import sqlite3
+import threading
+from datetime import datetime
+
+DEFAULT_DB_PATH = "training_data/video_history.db"
+LEGACY_JSON_PATH = "training_data/video_history.json"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS videos (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    title TEXT,
+    hook TEXT,
+    flash_prompt TEXT,
+    platform_ids TEXT,
+    views INTEGER DEFAULT 0,
+    shares INTEGER DEFAULT 0,
+    saves INTEGER DEFAULT 0,
+    created_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_videos_title ON videos(title);
+CREATE INDEX IF NOT EXISTS idx_videos_hook ON videos(hook);
+CREATE INDEX IF NOT EXISTS idx_videos_created ON videos(created_at);
+CREATE INDEX IF NOT EXISTS idx_videos_views ON videos(views);
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT,
+    started TEXT,
+    wall_s REAL,
+    cpu_s REAL,
+    child_cpu_s REAL,
+    peak_rss_mb REAL,
+    bytes_down INTEGER,
+    bytes_up INTEGER,
+    calls TEXT,
+    stage_wall_s TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_runs_started ON runs(started);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+METRIC_COLUMNS = ("views", "shares", "saves")
+
+
+class HistoryStore:
+    """
+    Video history in SQLite: O(1) appends, indexed lookups by title/hook/date and
+    in-place metric updates. On first use, entries from the legacy
+    video_history.json are imported once.
+    """
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH, legacy_json: str = LEGACY_JSON_PATH):
+        self.db_path = db_path
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        with self.conn:
+            self.conn.executescript(SCHEMA)
+        if legacy_json:
+            self.migrate_from_json(legacy_json)
+
+    def _migrated(self) -> bool:
+        with self._lock:
+            return self.conn.execute("SELECT value FROM meta WHERE key = 'migrated_json'").fetchone() is not None
+
+    def migrate_from_json(self, json_path: str) -> int:
+        """
+        Imports a legacy JSON history file once. Returns the number of entries
+        imported. The check and the import share one write transaction, so two
+        processes starting together cannot both import the file.
+        """
+        if not os.path.exists(json_path) or self._migrated():
+            return 0
+        try:
+            with open(json_path, 'r') as f:
+                history = json.load(f)
+        except Exception as e:
+            print(f"Warning: could not read legacy history {json_path}: {e}")
+            return 0
+
+        with self._lock, self.conn:
+            # Takes the write lock before re-checking, so the import happens at most once
+            self.conn.execute("BEGIN IMMEDIATE")
+            if self.conn.execute("SELECT value FROM meta WHERE key = 'migrated_json'").fetchone():
+                return 0
+            self.conn.executemany(
+                "INSERT INTO videos (title, hook, flash_prompt, platform_ids, views, shares, saves, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [self._row_values(entry) for entry in history]
+            )
+            self.conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('migrated_json', ?)",
+                (datetime.now().isoformat(timespec="seconds"),)
+            )
+        print(f"Migrated {len(history)} videos from {json_path} to {self.db_path}.")
+        return len(history)
+
+    @staticmethod
+    def _row_values(entry: dict) -> tuple:
+        metrics = entry.get("metrics") or {}
+        return (
+            entry.get("title"),
+            entry.get("hook"),
+            entry.get("flash_prompt"),
+            json.dumps(entry.get("platform_ids") or {}),
+            metrics.get("views", 0),
+            metrics.get("shares", 0),
+            metrics.get("saves", 0),
+            entry.get("created_at"),
+        )
+
+    @staticmethod
+    def _to_entry(row) -> dict:
+        """Row -> the dict shape used by the legacy JSON file."""
+        return {
+            "id": row["id"],
+            "title": row["title"],
+            "hook": row["hook"],
+            "flash_prompt": row["flash_prompt"],
+            "platform_ids": json.loads(row["platform_ids"] or "{}"),
+            "metrics": {m: row[m] for m in METRIC_COLUMNS},
+            "created_at": row["created_at"],
+        }
+
+    def append(self, entry: dict) -> int:
+        return self.append_many([entry])[0]
+
+    def append_many(self, entries: list) -> list:
+        """Appends entries in one transaction. Returns their ids."""
+        ids = []
+        with self._lock, self.conn:
+            for entry in entries:
+                entry = dict(entry)
+                entry.setdefault("created_at", datetime.now().isoformat(timespec="seconds"))
+                cur = self.conn.execute(
+                    "INSERT INTO videos (title, hook, flash_prompt, platform_ids, views, shares, saves, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    self._row_values(entry)
+                )
+                ids.append(cur.lastrowid)
+        return ids
+
+    def update_metrics(self, video_id: int, **metrics):
+        """e.g. update_metrics(12, views=1500, saves=40)"""
+        columns = [m for m in metrics if m in METRIC_COLUMNS]
+        if not columns:
+            return
+        with self._lock, self.conn:
+            self.conn.execute(
+                f"UPDATE videos SET {', '.join(f'{c} = ?' for c in columns)} WHERE id = ?",
+                [metrics[c] for c in columns] + [video_id]
+            )
+
+    def _query(self, sql: str, params=()) -> list:
+        with self._lock:
+            return [self._to_entry(r) for r in self.conn.execute(sql, params).fetchall()]
+
+    def all(self) -> list:
+        return self._query("SELECT * FROM videos ORDER BY id")
+
+    def find_by_title(self, title: str) -> list:
+        return self._query("SELECT * FROM videos WHERE title = ? ORDER BY id", (title,))
+
+    def find_by_hook(self, hook: str) -> list:
+        return self._query("SELECT * FROM videos WHERE hook = ? ORDER BY id", (hook,))
+
+    def find_by_date(self, start: str, end: str = None) -> list:
+        """Videos created between two ISO dates/datetimes (end exclusive)."""
+        if end:
+            return self._query("SELECT * FROM videos WHERE created_at >= ? AND created_at < ? ORDER BY id", (start, end))
+        return self._query("SELECT * FROM videos WHERE created_at >= ? ORDER BY id", (start,))
+
+    def high_performers(self, min_views: int = 1000) -> list:
+        return self._query("SELECT * FROM videos WHERE views > ? ORDER BY views DESC", (min_views,))
+
+    def recent_titles(self, limit: int = 15) -> list:
+        """Most recent unique titles, newest first."""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT title FROM videos WHERE title IS NOT NULL AND title != '' "
+                "GROUP BY title ORDER BY MAX(id) DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [r["title"] for r in rows]
+
+    def record_run(self, summary: dict):
+        """Appends a run's metrics summary (see RunMetrics.summary) for regression tracking."""
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO runs (run_id, started, wall_s, cpu_s, child_cpu_s, peak_rss_mb, bytes_down, bytes_up, calls, stage_wall_s) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    summary["run_id"],
+                    datetime.fromtimestamp(summary["started"]).isoformat(timespec="seconds"),
+                    summary["wall_s"], summary["cpu_s"], summary["child_cpu_s"], summary["peak_rss_mb"],
+                    summary["bytes_down"], summary["bytes_up"],
+                    json.dumps(summary["calls"]), json.dumps(summary["stage_wall_s"]),
+                )
+            )
+
+    def recent_runs(self, limit: int = 10) -> list:
+        """Latest run summaries, newest first."""
+        with self._lock:
+            rows = self.conn.execute("SELECT * FROM runs ORDER BY started DESC LIMIT ?", (limit,)).fetchall()
+        return [dict(r, calls=json.loads(r["calls"] or "{}"), stage_wall_s=json.loads(r["stage_wall_s"] or "{}")) for r in rows]
+
+    def count(self) -> int:
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM videos").fetchone()[0]
+
+
+class HistoryService:
+    """
+    Shared, lazily loaded in-memory view of the history for one process.
+    IdeaGenerator and FeedbackLoop read the derived views (recent titles,
+    high-performer hooks) from here; writes go through to the store and
+    invalidate the cached data.
+    """
+
+    def __init__(self, store: HistoryStore = None):
+        self._store = store
+        self._entries = None
+        self._views = {}
+        self._lock = threading.RLock()
+
+    @property
+    def store(self) -> HistoryStore:
+        if self._store is None:
+            self._store = HistoryStore()
+        return self._store
+
+    def entries(self) -> list:
+        """All videos, oldest first. Loaded from the store on first access."""
+        with self._lock:
+            if self._entries is None:
+                self._entries = self.store.all()
+            return self._entries
+
+    def _view(self, name, compute):
+        with self._lock:
+            if name not in self._views:
+                self._views[name] = compute(self.entries())
+            return self._views[name]
+
+    def invalidate(self):
+        with self._lock:
+            self._entries = None
+            self._views = {}
+
+    def recent_titles(self, limit: int = 15) -> list:
+        """Most recent unique titles, newest first."""
+        def _compute(entries):
+            titles = []
+            for v in reversed(entries):
+                if v.get("title") and v["title"] not in titles:
+                    titles.append(v["title"])
+            return titles
+        return self._view("recent_titles", _compute)[:limit]
+
+    def high_performer_hooks(self, min_views: int = 1000) -> list:
+        return self._view(
+            ("high_performer_hooks", min_views),
+            lambda entries: [v["hook"] for v in entries if v["metrics"]["views"] > min_views]
+        )
+
+    def similarity_index(self):
+        """Vector index over every past title and hook (built once per history version)."""
+        from modules.similarity import SimilarityIndex
+
+        def _compute(entries):
+            texts = {v[k] for v in entries for k in ("title", "hook") if v.get(k)}
+            return SimilarityIndex().build(sorted(texts))
+        return self._view("similarity_index", _compute)
+
+    def most_similar(self, idea: dict, extra_texts: list = None):
+        """
+        Returns (score, past title/hook) of the closest match to the idea's title
+        or hook. extra_texts (e.g. ideas made earlier in the same batch, not yet
+        in history) are compared as if they were past videos.
+        """
+        index = self.similarity_index()
+        if extra_texts:
+            from modules.similarity import SimilarityIndex
+            index = SimilarityIndex().build(sorted(set(index.texts) | set(extra_texts)))
+        matches = [index.most_similar(idea[k]) for k in ("title", "hook_text") if idea.get(k)]
+        return max(matches, default=(0.0, None), key=lambda m: m[0])
+
+    def append_many(self, entries: list) -> list:
+        ids = self.store.append_many(entries)
+        self.invalidate()
+        return ids
+
+    def update_metrics(self, video_id: int, **metrics):
+        self.store.update_metrics(video_id, **metrics)
+        self.invalidate()
+
+    def record_run(self, summary: dict):
+        # Run metrics are not part of the video views, so nothing to invalidate
+        self.store.record_run(summary)
+
+
+if __name__ == "__main__":
+    # python -m modules.history_store             one-time migration and a summary
+    # python -m modules.history_store export      whole history as JSON (for n8n)
+    # python -m modules.history_store append --title "..." [--hook "..."]
+    import argparse
+    parser = argparse.ArgumentParser(description="Video history store")
+    parser.add_argument("command", nargs="?", choices=["summary", "export", "append"], default="summary")
+    parser.add_argument("--title")
+    parser.add_argument("--hook")
+    parser.add_argument("--db", default=DEFAULT_DB_PATH)
+    args = parser.parse_args()
+
+    store = HistoryStore(args.db)
+    if args.command == "export":
+        print(json.dumps(store.all(), indent=2))
+    elif args.command == "append":
+        if not args.title:
+            parser.error("append needs --title")
+        print(store.append({"title": args.title, "hook": args.hook}))
+    else:
+        print(f"{store.db_path}: {store.count()} videos. Most recent titles: {store.recent_titles(5)}")
@@ -0,0 +1,144 @@
+import os
+import time
+import random
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlparse
+from urllib3.exceptions import ConnectTimeoutError
+
+from modules import metrics
+
+# Transient statuses worth retrying (rate limits and server errors)
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "PUT", "DELETE", "OPTIONS"}
+
+
+def _never_sent(error) -> bool:
+    """True if the request failed while connecting, so the server cannot have acted on it."""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    # Refused / unresolvable connections (urllib3's NewConnectionError is a ConnectTimeoutError)
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(error, requests.ConnectionError) and isinstance(reason, ConnectTimeoutError)
+
+
+class HTTPClient:
+    """
+    Shared HTTP layer: one keep-alive session with pooled connections (at most
+    `max_per_host` concurrent connections per host), default timeouts, and
+    retries with exponential backoff + jitter on 429/5xx and connection errors.
+    """
+
+    def __init__(self, max_per_host: int = None, connect_timeout: float = None, read_timeout: float = None,
+                 retries: int = None, backoff: float = None, chunk_size: int = None):
+        self.max_per_host = max_per_host or int(os.getenv("HTTP_MAX_PER_HOST", "8"))
+        self.timeout = (
+            connect_timeout or float(os.getenv("HTTP_CONNECT_TIMEOUT", "10")),
+            read_timeout or float(os.getenv("HTTP_READ_TIMEOUT", "60")),
+        )
+        self.retries = retries if retries is not None else int(os.getenv("HTTP_RETRIES", "4"))
+        self.backoff = backoff or float(os.getenv("HTTP_BACKOFF", "1.0"))
+        self.chunk_size = chunk_size or int(os.getenv("HTTP_CHUNK_KB", "1024")) * 1024
+
+        self.session = requests.Session()
+        # pool_block makes extra threads wait for a free connection instead of opening more
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=self.max_per_host, pool_block=True)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def _delay(self, attempt: int, response=None) -> float:
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), 60.0)
+            except ValueError:
+                pass
+        base = self.backoff * (2 ** attempt)
+        return base / 2 + random.uniform(0, base / 2)
+
+    @staticmethod
+    def _rewind(kwargs):
+        """Seeks file bodies back to the start so a retried upload resends them whole."""
+        for key in ("files", "data"):
+            value = kwargs.get(key)
+            values = value.values() if isinstance(value, dict) else [value]
+            for item in values:
+                handle = item[1] if isinstance(item, tuple) and len(item) > 1 else item
+                if hasattr(handle, "seek"):
+                    handle.seek(0)
+
+    def request(self, method: str, url: str, retry=None, **kwargs) -> requests.Response:
+        """
+        Like requests.request, through the shared session. Non-idempotent methods
+        (e.g. POST) are only retried with retry=True, or with retry="connect":
+        connect failures and 429/5xx responses only, never a read timeout or
+        dropped connection after the request may have been accepted. Returns the
+        last response (check status as usual); raises the last exception if every
+        attempt failed.
+        """
+        method = method.upper()
+        if retry is None:
+            retry = method in IDEMPOTENT_METHODS
+        kwargs.setdefault("timeout", self.timeout)
+        attempts = self.retries + 1 if retry else 1
+
+        host = urlparse(url).hostname
+        for attempt in range(attempts):
+            if attempt:
+                self._rewind(kwargs)
+            try:
+                metrics.count(f"http:{host}")
+                response = self.session.request(method, url, **kwargs)
+                self._count_bytes(response, streamed=kwargs.get("stream", False))
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt + 1 >= attempts or (retry == "connect" and not _never_sent(e)):
+                    raise
+                delay = self._delay(attempt)
+                print(f"[HTTP] {method} {url.split('?')[0]} failed ({e.__class__.__name__}). Retrying in {delay:.1f}s...")
+                time.sleep(delay)
+                continue
+
+            if response.status_code not in RETRY_STATUSES or attempt + 1 >= attempts:
+                return response
+            delay = self._delay(attempt, response)
+            print(f"[HTTP] {method} {url.split('?')[0]} returned {response.status_code}. Retrying in {delay:.1f}s...")
+            response.close()
+            time.sleep(delay)
+
+    @staticmethod
+    def _count_bytes(response, streamed: bool):
+        body = response.request.body
+        sent = len(body) if hasattr(body, "__len__") else 0
+        # Streamed bodies are counted as they are read (see download())
+        received = 0 if streamed else len(response.content)
+        metrics.count(bytes_down=received, bytes_up=sent)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def download(self, url: str, path: str, **kwargs):
+        """Streams a response body to `path` in large chunks. Raises on HTTP errors."""
+        with self.get(url, stream=True, **kwargs) as r:
+            r.raise_for_status()
+            with open(path, 'wb') as f:
+                for chunk in r.iter_content(chunk_size=self.chunk_size):
+                    f.write(chunk)
+                    metrics.count(bytes_down=len(chunk))
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> HTTPClient:
+    """Process-wide client, so every module shares one connection pool."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HTTPClient()
+        return _client
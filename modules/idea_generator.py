@@ -1,28 +1,27 @@
 import os
 import json
-try:
-    from openai import OpenAI
-except ImportError:
-    OpenAI = None
-    print("Warning: openai module not found. Running in Free Mode.")
-import google.generativeai as genai
+import threading
+
+from modules import providers
+from modules.history_store import HistoryService
+from modules.llm_cache import LLMCache
+from modules.llm_router import ProviderRouter
+from modules.json_stream import JSONStreamExtractor, ArrayItemStream, extract_json, validate_idea, repair_idea, repair_segment
+
+EMERGENCY_FALLBACK_TITLE = "The Hidden Mathematics of Trading"
 
 class IdeaGenerator:
-    def __init__(self, api_key=None):
-        self.client = None
-        key = api_key or os.getenv("OPENAI_API_KEY")
-        if key:
-            try:
-                self.client = OpenAI(api_key=key)
-            except Exception as e:
-                print(f"Warning: OpenAI init failed: {e}")
-        else:
+    def __init__(self, api_key=None, history: HistoryService = None, llm_cache: LLMCache = None, router: ProviderRouter = None):
+        # SDK clients are created on first use (see `client` / `genai`), so
+        # constructing the generator does not import openai or google.generativeai
+        self.openai_key = api_key or os.getenv("OPENAI_API_KEY")
+        self._client = None
+        if not self.openai_key:
             print("Warning: OPENAI_API_KEY not found. Idea generation will be mocked.")
         
         self.gemini_key = os.getenv("GEMINI_API_KEY")
-        if self.gemini_key:
-            genai.configure(api_key=self.gemini_key)
-        else:
+        self._genai = None
+        if not self.gemini_key:
             print("Warning: GEMINI_API_KEY not found.")
         
         self.strategies = [
@@ -32,24 +31,134 @@ class IdeaGenerator:
             "News Reaction", 
             "Personal Story"
         ]
-        self.history_file = "training_data/video_history.json"
+        self.history = history or HistoryService()
+        self.llm_cache = llm_cache or LLMCache()
+        self.router = router or ProviderRouter()
+
+    @property
+    def client(self):
+        """OpenAI client, or None without a key / the openai package."""
+        if self._client is None and self.openai_key:
+            OpenAI = providers.load("llm", "openai")
+            if OpenAI is None:
+                print("Warning: openai module not found. Running in Free Mode.")
+                self.openai_key = None
+                return None
+            try:
+                self._client = OpenAI(api_key=self.openai_key)
+            except Exception as e:
+                print(f"Warning: OpenAI init failed: {e}")
+                self.openai_key = None
+        return self._client
+
+    @property
+    def genai(self):
+        """Configured google.generativeai module (imported on first Gemini call)."""
+        if self._genai is None:
+            genai = providers.load("llm", "gemini")
+            if genai is None:
+                raise RuntimeError("google-generativeai is not installed")
+            genai.configure(api_key=self.gemini_key)
+            self._genai = genai
+        return self._genai
+
+    def _gemini_text(self, kind: str, model_name: str, prompt: str, json_opener: str = None, on_text=None) -> str:
+        """
+        Gemini call through the response cache. Returns the response text.
+        With json_opener ('{' or '['), the response is streamed and reading stops
+        at the end of the first complete JSON value, which is returned on its own.
+        on_text(chunk) sees each streamed chunk (not called on cache hits).
+        """
+        def _call():
+            model = self.genai.GenerativeModel(model_name)
+            options = {"timeout": self.router.deadline}
+            if not json_opener:
+                return model.generate_content(prompt, request_options=options).text
+            extractor = JSONStreamExtractor(json_opener)
+            received = []
+            for chunk in model.generate_content(prompt, stream=True, request_options=options):
+                received.append(chunk.text)
+                if on_text:
+                    on_text(chunk.text)
+                if extractor.feed(chunk.text) is not None:
+                    return extractor.text
+            return "".join(received)
+        return self.llm_cache.get_or_call(kind, "gemini", model_name, prompt, _call)
+
+    @staticmethod
+    def _openai_cache_prompt(messages: list, **kwargs) -> str:
+        return json.dumps([messages, kwargs], sort_keys=True)
+
+    def _openai_text(self, kind: str, messages: list, model_name: str = "gpt-4o", on_text=None, **kwargs) -> str:
+        """
+        OpenAI chat call through the response cache. Returns the message content.
+        With on_text, the response is streamed and on_text(chunk) sees each delta.
+        """
+        prompt = self._openai_cache_prompt(messages, **kwargs)
+        def _call():
+            if on_text:
+                parts = []
+                stream = self.client.chat.completions.create(model=model_name, messages=messages, timeout=self.router.deadline, stream=True, **kwargs)
+                for chunk in stream:
+                    delta = chunk.choices[0].delta.content if chunk.choices else None
+                    if delta:
+                        parts.append(delta)
+                        on_text(delta)
+                return "".join(parts)
+            response = self.client.chat.completions.create(model=model_name, messages=messages, timeout=self.router.deadline, **kwargs)
+            return response.choices[0].message.content
+        return self.llm_cache.get_or_call(kind, "openai", model_name, prompt, _call)
+
+    def _parse_idea(self, provider: str, text: str, invalidate) -> dict:
+        """
+        Extracts the idea JSON from a model response, validates it and fills
+        defaults. Missing required fields are requested on their own instead of
+        regenerating the whole script. `invalidate()` drops the cached response
+        if it turns out to be unusable.
+        """
+        try:
+            idea = extract_json(text)
+        except ValueError:
+            invalidate()
+            raise
+        missing = validate_idea(idea)
+        if missing:
+            print(f"Idea from {provider} is missing {missing}. Requesting only those fields...")
+            try:
+                idea.update(self._request_missing_fields(provider, idea, missing))
+            except Exception as e:
+                print(f"Field repair failed: {e}")
+            missing = validate_idea(idea)
+            if missing:
+                invalidate()
+                raise ValueError(f"Idea from {provider} is missing {missing}")
+        return repair_idea(idea)
+
+    def _request_missing_fields(self, provider: str, idea: dict, missing: list) -> dict:
+        partial = json.dumps({k: v for k, v in idea.items() if k not in missing})
+        prompt = f"""
+        This is a partial JSON video script: {partial}
+        Return ONLY a JSON object containing these keys, consistent with the rest of the script: {', '.join(missing)}.
+        "title" and "hook_text" are strings. "script_segments" is an array of 7 objects:
+        {{"text": "spoken words (2-3 sentences)", "visual_keyword": "search term", "duration_est": 5.0}}
+        """
+        if provider == "openai":
+            text = self._openai_text("idea_repair", [{"role": "user", "content": prompt}], response_format={"type": "json_object"})
+        else:
+            text = self._gemini_text("idea_repair", 'gemini-flash-latest', prompt, json_opener="{")
+        fields = extract_json(text)
+        return {k: fields[k] for k in missing if k in fields}
 
     def _get_history_constraints(self) -> str:
         """Loads video history and returns a string for negative prompt constraints."""
-        print(f"DEBUG: Checking history file at: {os.path.abspath(self.history_file)}")
-        if not os.path.exists(self.history_file):
-            print("DEBUG: History file not found.")
-            return ""
         try:
-            with open(self.history_file, 'r') as f:
-                history = json.load(f)
-                # Get the last 15 unique titles to prevent repetition
-                titles = list(set([v.get('title') for v in history if v.get('title')]))[-15:]
-                if not titles:
-                    return ""
-                constraint_msg = f"\nCRITICAL: DO NOT REPEAT these previous video titles or concepts: {', '.join(titles)}"
-                print(f"DEBUG: Content Constraints applied for {len(titles)} previous videos.")
-                return constraint_msg
+            # Get the last 15 unique titles to prevent repetition
+            titles = self.history.recent_titles(15)
+            if not titles:
+                return ""
+            constraint_msg = f"\nCRITICAL: DO NOT REPEAT these previous video titles or concepts: {', '.join(titles)}"
+            print(f"DEBUG: Content Constraints applied for {len(titles)} previous videos.")
+            return constraint_msg
         except Exception as e:
             print(f"DEBUG: Error loading history for constraints: {e}")
             return ""
@@ -61,15 +170,95 @@ class IdeaGenerator:
         # For now, random rotation ensures variety.
         return random.choice(self.strategies)
 
-    def generate_idea(self, topic: str = "Trading", research_context: str = None) -> dict:
+    def generate_idea(self, topic: str = "Trading", research_context: str = None, on_segment=None, batch_ideas: list = None) -> dict:
         """
-        Generates a viral trading video idea.
+        Generates a viral trading video idea, regenerating when it is a
+        near-duplicate of a past video (local similarity index over all history).
+        batch_ideas: ideas already made in this invocation; they are not in the
+        history yet, so they are checked (and named to the model) explicitly.
+        on_segment(seg) is called with each script segment as soon as it has been
+        streamed, before the full idea is complete. Segments of rejected or failed
+        attempts are streamed too, so the consumer must match the final idea's
+        segments against what it already started.
         """
-        if not self.client:
-           if self.gemini_key:
-               return self.generate_idea_free(topic, research_context)
-           return self.get_emergency_fallback()
+        if not self.client and not self.gemini_key:
+            return self.get_emergency_fallback()
+
+        threshold = float(os.getenv("IDEA_SIMILARITY_THRESHOLD", "0.7"))
+        attempts = int(os.getenv("IDEA_DEDUP_ATTEMPTS", "3"))
+        batch_texts = [i[k] for i in batch_ideas or [] for k in ("title", "hook_text") if i.get(k)]
+        avoid = [i['title'] for i in batch_ideas or [] if i.get('title')]
+        best = None  # (score, idea) with the lowest similarity seen
+        for attempt in range(attempts):
+            idea = self._generate_idea_once(topic, research_context, avoid, on_segment)
+            if not idea or idea.get('title') == EMERGENCY_FALLBACK_TITLE:
+                return idea
+            try:
+                score, match = self.history.most_similar(idea, batch_texts)
+            except Exception as e:
+                print(f"DEBUG: Duplicate check failed: {e}")
+                return idea
+            if score < threshold:
+                return idea
+            print(f"Idea '{idea.get('title')}' is {score:.0%} similar to past video '{match}'. Regenerating...")
+            if match not in avoid:
+                avoid.append(match)
+            if best is None or score < best[0]:
+                best = (score, idea)
+        print("Could not find a unique idea. Using the least similar candidate.")
+        return best[1]
+
+    def _generate_idea_once(self, topic: str, research_context: str = None, avoid: list = None, on_segment=None) -> dict:
+        """
+        Routes one idea request across the configured providers (hedged, with a
+        deadline) and falls back to the emergency template if all of them fail.
+        """
+        streams = self._segment_streams(on_segment) if on_segment else lambda name: None
+        providers = {}
+        if self.client:
+            providers["openai"] = lambda: self._openai_idea(topic, research_context, avoid, on_text=streams("openai"))
+        if self.gemini_key:
+            providers["gemini"] = lambda: self._gemini_idea(topic, research_context, avoid, on_text=streams("gemini"))
+        if not providers:
+            return self.get_emergency_fallback()
+        try:
+            _, idea = self.router.call(providers, validate=lambda idea: not validate_idea(idea))
+            return idea
+        except Exception as e:
+            print(f"Error generating idea: {e}")
+            return self.get_emergency_fallback()
+
+    @staticmethod
+    def _segment_streams(on_segment):
+        """
+        Returns streams(provider) -> on_text callback that parses script segments
+        out of that provider's token stream. With hedged requests, only the first
+        provider to produce a segment forwards them to on_segment.
+        """
+        owner = []
+        lock = threading.Lock()
 
+        def streams(name):
+            parser = ArrayItemStream("script_segments")
+
+            def _on_text(chunk):
+                for seg in parser.feed(chunk):
+                    if not isinstance(seg, dict) or not str(seg.get("text", "")).strip():
+                        continue
+                    with lock:
+                        if not owner:
+                            owner.append(name)
+                    if owner[0] != name:
+                        return
+                    try:
+                        on_segment(repair_segment(seg))
+                    except Exception as e:
+                        print(f"DEBUG: Streamed segment handler failed: {e}")
+            return _on_text
+        return streams
+
+    def _openai_idea(self, topic: str, research_context: str = None, avoid: list = None, on_text=None) -> dict:
+        """Generates idea using OpenAI. Raises on failure."""
         strategy = self.select_strategy()
         
         system_prompt = f"""
@@ -109,27 +298,22 @@ class IdeaGenerator:
         user_prompt = f"Generate a viral trading video idea about: {topic}."
         if research_context:
             user_prompt += f"\n\nUSE THIS DEEP RESEARCH:\n{research_context}"
+        if avoid:
+            user_prompt += f"\n\nThe idea MUST be clearly different from these past videos: {'; '.join(avoid)}"
         
-        try:
-            response = self.client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                response_format={"type": "json_object"}
-            )
-            content = response.choices[0].message.content
-            return json.loads(content)
-        except Exception as e:
-            print(f"Error generating idea: {e}")
-            return self.get_emergency_fallback()
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
+        content = self._openai_text("idea", messages, on_text=on_text, response_format={"type": "json_object"})
+        return self._parse_idea("openai", content, lambda: self.llm_cache.invalidate(
+            "idea", "openai", "gpt-4o", self._openai_cache_prompt(messages, response_format={"type": "json_object"})))
 
     def get_emergency_fallback(self):
         """Returns a pre-written DEEP viral loop if AI fails."""
         print("[ALERT] Using Emergency Fallback Template (Deep Mode).")
         return {
-            "title": "The Hidden Mathematics of Trading",
+            "title": EMERGENCY_FALLBACK_TITLE,
             "hook_text": "You are losing money because you don't understand this one math equation.",
             "script_segments": [
                 {"text": "Most traders think patterns move the market. They are wrong.", "visual_keyword": "Stock Chart Red", "duration_est": 3.0},
@@ -148,12 +332,21 @@ class IdeaGenerator:
             "description": "#trading #finance #smartmoney #shorts"
         }
 
-    def generate_idea_free(self, topic: str, research_context: str = None) -> dict:
+    def generate_idea_free(self, topic: str, research_context: str = None, avoid: list = None) -> dict:
         """Generates idea using Google Gemini (Free Tier)."""
+        try:
+            return self._gemini_idea(topic, research_context, avoid)
+        except Exception as e:
+            print(f"Gemini Error: {e}")
+            return self.get_emergency_fallback()
+
+    def _gemini_idea(self, topic: str, research_context: str = None, avoid: list = None, on_text=None) -> dict:
+        """Gemini idea generation. Raises on failure."""
         print("Using Google Gemini (Free Tier)...")
-        model = genai.GenerativeModel('gemini-flash-latest')
         
         constraints = self._get_history_constraints()
+        if avoid:
+            constraints += f"\nCRITICAL: Your idea was too similar to: {'; '.join(avoid)}. Pick a clearly different angle."
         prompt = f"""
         Act as a Master Trading Educator and Viral Content Strategist. 
         Create a DEEP, EDUCATIONAL, yet VIRAL video script about: {topic}.
@@ -189,14 +382,8 @@ class IdeaGenerator:
             "description": "hashtags"
         }}
         """
-        try:
-            response = model.generate_content(prompt)
-            # Cleanup markdown if present
-            clean_text = response.text.replace("```json", "").replace("```", "")
-            return json.loads(clean_text)
-        except Exception as e:
-            print(f"Gemini Error: {e}")
-            return self.get_emergency_fallback()
+        text = self._gemini_text("idea", 'gemini-flash-latest', prompt, json_opener="{", on_text=on_text)
+        return self._parse_idea("gemini", text, lambda: self.llm_cache.invalidate("idea", "gemini", 'gemini-flash-latest', prompt))
 
     def get_trending_topic(self, niche: str = "Trading") -> str:
         """
@@ -214,12 +401,12 @@ class IdeaGenerator:
         """
         
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-4o",
-                messages=[{"role": "user", "content": "What is the #1 trending topic right now?"}],
+            content = self._openai_text(
+                "topic",
+                [{"role": "user", "content": "What is the #1 trending topic right now?"}],
                 max_tokens=20
             )
-            return response.choices[0].message.content.strip()
+            return content.strip()
         except Exception as e:
             print(f"Error fetching trend: {e}")
             return "Bitcoin Price Action"
@@ -230,13 +417,17 @@ class IdeaGenerator:
         if not self.gemini_key:
              return ["Bitcoin", "Nvidia", "Inflation", "Gold", "AI Bubble"] # Fallback
 
-        model = genai.GenerativeModel('gemini-flash-latest')
         constraints = self._get_history_constraints()
         prompt = f"List the Top 5 Most Viral Trending Topics in {niche} right now. {constraints} Return ONLY a JSON list of strings."
         try:
-            response = model.generate_content(prompt)
-            clean_text = response.text.replace("```json", "").replace("```", "")
-            return json.loads(clean_text)
+            text = self._gemini_text("trends", 'gemini-flash-latest', prompt, json_opener="[")
+            trends = [t for t in extract_json(text, "[") if isinstance(t, str) and t.strip()]
+            if not trends:
+                raise ValueError("empty trend list")
+            return trends
+        except ValueError:
+            self.llm_cache.invalidate("trends", "gemini", 'gemini-flash-latest', prompt)
+            return ["Bitcoin", "AI Trading", "Market Crash", "Interest Rates", "Passive Income"]
         except:
              return ["Bitcoin", "AI Trading", "Market Crash", "Interest Rates", "Passive Income"]
 
@@ -246,7 +437,6 @@ class IdeaGenerator:
         if not self.gemini_key:
             return "Mock Research: This topic is trending due to recent price action."
         
-        model = genai.GenerativeModel('gemini-2.0-flash')
         prompt = f"""
         Analyze the topic '{topic}' for a viral video.
         Return a short research summary covering:
@@ -257,8 +447,7 @@ class IdeaGenerator:
         Keep it concise.
         """
         try:
-            response = model.generate_content(prompt)
-            return response.text
+            return self._gemini_text("research", 'gemini-2.0-flash', prompt)
         except Exception as e:
             return f"Research failed: {e}"
 
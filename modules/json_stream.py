@@ -0,0 +1,177 @@
+import re
+import json
+
+
+class JSONStreamExtractor:
+    """
+    Incrementally finds the first balanced JSON object (or array) in a stream of
+    text chunks, ignoring any prose or ``` fences around it. feed() returns the
+    parsed value as soon as the closing bracket arrives, so the caller can stop
+    reading the model's stream right there.
+    """
+
+    def __init__(self, opener: str = "{"):
+        self.opener = opener
+        self.closer = "}" if opener == "{" else "]"
+        self.buffer = []
+        self.started = False
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.result = None
+        self.done = False
+
+    def feed(self, chunk: str):
+        """Consumes a chunk. Returns the parsed value once complete, else None."""
+        if self.done:
+            return self.result
+        for ch in chunk:
+            if not self.started:
+                if ch != self.opener:
+                    continue
+                self.started = True
+
+            self.buffer.append(ch)
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                self.in_string = True
+            elif ch in "{[":
+                self.depth += 1
+            elif ch in "}]":
+                self.depth -= 1
+                if self.depth == 0:
+                    text = "".join(self.buffer)
+                    try:
+                        self.result = json.loads(text)
+                        self.done = True
+                        return self.result
+                    except json.JSONDecodeError:
+                        # e.g. a stray '{' in the prose: restart at the next opener
+                        self.buffer, self.started = [], False
+        return None
+
+    @property
+    def text(self) -> str:
+        """The JSON text consumed so far."""
+        return "".join(self.buffer)
+
+
+class ArrayItemStream:
+    """
+    Incrementally parses the items of one array field ("key": [...]) of a
+    streamed JSON object. feed() returns the items completed by each chunk, so
+    e.g. script segments can be processed while the rest is still generating.
+    """
+
+    def __init__(self, key: str):
+        self.pattern = re.compile(r'"%s"\s*:\s*\[' % re.escape(key))
+        self.buffer = ""
+        self.pos = None  # Next character to scan, once the array has started
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.item_start = None
+        self.closed = False
+
+    def feed(self, chunk: str) -> list:
+        self.buffer += chunk
+        if self.closed:
+            return []
+        if self.pos is None:
+            match = self.pattern.search(self.buffer)
+            if not match:
+                return []
+            self.pos = match.end()
+
+        items = []
+        while self.pos < len(self.buffer):
+            ch = self.buffer[self.pos]
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                self.in_string = True
+            elif ch in "{[":
+                if self.depth == 0:
+                    self.item_start = self.pos
+                self.depth += 1
+            elif ch in "}]":
+                if self.depth == 0:
+                    self.closed = True  # End of the array
+                    break
+                self.depth -= 1
+                if self.depth == 0:
+                    try:
+                        items.append(json.loads(self.buffer[self.item_start:self.pos + 1]))
+                    except json.JSONDecodeError:
+                        pass
+            self.pos += 1
+        return items
+
+
+def extract_json(text: str, opener: str = "{"):
+    """First balanced JSON object/array in `text`. Raises ValueError if there is none."""
+    extractor = JSONStreamExtractor(opener)
+    result = extractor.feed(text)
+    if not extractor.done:
+        raise ValueError("No complete JSON value found in model response")
+    return result
+
+
+# Idea dict schema: required fields cannot be invented; optional ones get defaults
+REQUIRED_IDEA_FIELDS = ("title", "hook_text", "script_segments")
+OPTIONAL_IDEA_DEFAULTS = {
+    "flash_prompt_content": "",
+    "flash_prompt_time_index": 10,
+    "caption_keywords": [],
+    "first_comment_question": "Bullish or Bearish?",
+    "description": "#trading #finance #shorts",
+}
+WORDS_PER_SECOND = 2.5
+
+
+def validate_idea(idea) -> list:
+    """Returns the required fields that are missing or malformed (empty list = valid)."""
+    if not isinstance(idea, dict):
+        return list(REQUIRED_IDEA_FIELDS)
+    missing = [f for f in ("title", "hook_text") if not isinstance(idea.get(f), str) or not idea[f].strip()]
+    segments = idea.get("script_segments")
+    if not isinstance(segments, list) or not segments or \
+            not all(isinstance(s, dict) and isinstance(s.get("text"), str) and s["text"].strip() for s in segments):
+        missing.append("script_segments")
+    return missing
+
+
+def repair_idea(idea: dict, default_keyword: str = "Money") -> dict:
+    """
+    Fills optional fields and per-segment defaults (visual_keyword, duration_est)
+    in place. Required fields are left to validate_idea.
+    """
+    for field, default in OPTIONAL_IDEA_DEFAULTS.items():
+        if idea.get(field) in (None, ""):
+            idea[field] = default if not isinstance(default, list) else list(default)
+    for seg in idea.get("script_segments") or []:
+        if isinstance(seg, dict):
+            repair_segment(seg, default_keyword)
+    return idea
+
+
+def repair_segment(seg: dict, default_keyword: str = "Money") -> dict:
+    """Fills visual_keyword and duration_est of one script segment in place."""
+    if not seg.get("visual_keyword"):
+        seg["visual_keyword"] = default_keyword
+    try:
+        seg["duration_est"] = float(seg["duration_est"])
+    except (KeyError, TypeError, ValueError):
+        seg["duration_est"] = round(max(len(str(seg.get("text", "")).split()) / WORDS_PER_SECOND, 1.0), 1)
+    return seg
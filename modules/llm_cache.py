@@ -0,0 +1,104 @@
+import os
+import json
+import time
+import threading
+from concurrent.futures import Future
+
+from modules.cache import DiskCache, cache_key
+from modules import metrics
+
+# Seconds a response stays valid, per call type (override with LLM_CACHE_TTL_<KIND>).
+# Call types not listed (e.g. "idea", "idea_repair") are never cached: the same
+# topic must still yield a new script for every video (a resumed run replays its
+# idea from the run manifest instead).
+DEFAULT_TTLS = {
+    "trends": 3600,        # Trends move fast
+    "topic": 3600,
+    "research": 86400,
+}
+
+
+class LLMCache:
+    """
+    Disk cache for LLM responses keyed by (call type, provider, model, prompt),
+    with a TTL per call type. Concurrent identical requests are coalesced: only
+    the first one calls the provider, the others wait for its result. Call
+    types without a TTL always go to the provider.
+    """
+
+    def __init__(self, ttls: dict = None, cache: DiskCache = None):
+        self.ttls = dict(DEFAULT_TTLS)
+        for kind in self.ttls:
+            value = os.getenv(f"LLM_CACHE_TTL_{kind.upper()}")
+            if value:
+                self.ttls[kind] = int(value)
+        self.ttls.update(ttls or {})
+        self.cache = cache or DiskCache("llm", max_bytes=50 * 1024 * 1024, max_age_days=7)
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def _key(self, kind, provider, model, prompt) -> str:
+        return cache_key(kind, provider, model, prompt)
+
+    def _read(self, key: str, ttl: int):
+        path = self.cache.get(key, ".json")
+        if not path:
+            return None
+        try:
+            with open(path, 'r') as f:
+                entry = json.load(f)
+        except Exception:
+            return None
+        # The file mtime tracks LRU use, so the creation time is stored in the entry
+        if time.time() - entry.get("created", 0) > ttl:
+            return None
+        return entry
+
+    def get_or_call(self, kind: str, provider: str, model: str, prompt: str, call, refresh: bool = False):
+        """
+        Returns the cached response for this prompt, or runs `call()` (which must
+        return a JSON-serializable value, usually the response text) and caches it.
+        Exceptions are not cached.
+        """
+        ttl = self.ttls.get(kind)
+        if not ttl:
+            metrics.count(f"llm:{provider}")
+            return call()
+
+        key = self._key(kind, provider, model, prompt)
+        if not refresh:
+            entry = self._read(key, ttl)
+            if entry:
+                print(f"[LLM cache] Hit for {kind} ({provider}/{model}).")
+                metrics.count(f"llm_cache_hit:{provider}")
+                return entry["value"]
+
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[key] = future
+        if not owner:
+            print(f"[LLM cache] Waiting for identical in-flight {kind} request.")
+            return future.result()
+
+        try:
+            metrics.count(f"llm:{provider}")
+            value = call()
+            payload = json.dumps({"created": time.time(), "kind": kind, "provider": provider, "model": model, "value": value})
+            self.cache.put_bytes(key, payload.encode("utf-8"), ".json")
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def invalidate(self, kind: str, provider: str, model: str, prompt: str):
+        """Drops a cached response, e.g. when it turned out to be unparseable."""
+        path = self.cache.path_for(self._key(kind, provider, model, prompt), ".json")
+        if os.path.exists(path):
+            os.remove(path)
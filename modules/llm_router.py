@@ -0,0 +1,159 @@
+import os
+import json
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from modules import metrics
+from modules.cache import CACHE_ROOT
+
+
+class ProviderStats:
+    """Rolling latency / error record for one provider."""
+
+    def __init__(self, latencies=None, successes: int = 0, errors: int = 0):
+        self.latencies = deque(latencies or [], maxlen=50)
+        self.successes = successes
+        self.errors = errors
+
+    def percentile(self, q: float):
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    @property
+    def error_rate(self) -> float:
+        total = self.successes + self.errors
+        return self.errors / total if total else 0.0
+
+
+class ProviderRouter:
+    """
+    Runs one logical LLM request against several providers:
+    - tries the provider with the best record first (error rate, then median latency),
+    - fires a hedged request to the next provider if the first is slower than its
+      usual latency percentile (or fails),
+    - returns the first valid result, and gives up at the overall deadline.
+    Stats are persisted so later runs start with the right order.
+    """
+
+    def __init__(self, deadline: float = None, hedge_percentile: float = None, default_hedge_delay: float = None, stats_path: str = None):
+        self.deadline = deadline or float(os.getenv("LLM_DEADLINE", "90"))
+        self.hedge_percentile = hedge_percentile or float(os.getenv("LLM_HEDGE_PERCENTILE", "0.9"))
+        self.default_hedge_delay = default_hedge_delay or float(os.getenv("LLM_HEDGE_DELAY", "15"))
+        # Cache hits record near-zero latencies; never hedge faster than this
+        self.min_hedge_delay = float(os.getenv("LLM_HEDGE_MIN_DELAY", "3"))
+        self.stats_path = stats_path or os.path.join(CACHE_ROOT, "llm_router_stats.json")
+        self._lock = threading.Lock()
+        self.stats = self._load_stats()
+
+    def _load_stats(self) -> dict:
+        if os.path.exists(self.stats_path):
+            try:
+                with open(self.stats_path, 'r') as f:
+                    return {name: ProviderStats(**data) for name, data in json.load(f).items()}
+            except Exception as e:
+                print(f"Warning: could not load provider stats: {e}")
+        return {}
+
+    def _save_stats(self):
+        os.makedirs(os.path.dirname(self.stats_path) or ".", exist_ok=True)
+        data = {name: {"latencies": list(s.latencies), "successes": s.successes, "errors": s.errors}
+                for name, s in self.stats.items()}
+        tmp_path = f"{self.stats_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.stats_path)
+
+    def _record(self, name: str, latency: float, ok: bool = None):
+        """ok=None records a request that lost the race: only its elapsed time (a lower bound) counts."""
+        with self._lock:
+            stats = self.stats.setdefault(name, ProviderStats())
+            if ok is None:
+                stats.latencies.append(latency)
+            elif ok:
+                stats.successes += 1
+                stats.latencies.append(latency)
+            else:
+                stats.errors += 1
+            try:
+                self._save_stats()
+            except OSError as e:
+                print(f"Warning: could not save provider stats: {e}")
+
+    def order(self, names: list) -> list:
+        def _rank(name):
+            stats = self.stats.get(name)
+            if not stats:
+                return (0.0, 0.0)
+            return (round(stats.error_rate, 1), stats.percentile(0.5) or 0.0)
+        return sorted(names, key=_rank)
+
+    def hedge_delay(self, name: str) -> float:
+        stats = self.stats.get(name)
+        delay = stats.percentile(self.hedge_percentile) if stats else None
+        return min(max(delay or self.default_hedge_delay, self.min_hedge_delay), self.deadline)
+
+    def call(self, providers: dict, validate=None):
+        """
+        providers: {name: fn()}; each fn returns a result or raises.
+        validate: optional fn(result) -> bool; invalid results count as failures.
+        Returns (provider name, result). Raises RuntimeError if all fail or time out.
+        """
+        queue = self.order(list(providers))
+        start = time.monotonic()
+        pool = ThreadPoolExecutor(max_workers=len(queue))
+        running = {}  # future -> (name, started)
+        errors = []
+
+        def _launch():
+            name = queue.pop(0)
+            print(f"[Router] Requesting {name}...")
+            # Pool threads don't inherit the caller's stage; measure each provider as a sub-stage of it
+            running[pool.submit(metrics.bind(providers[name], f"llm[{name}]"))] = (name, time.monotonic())
+            return name
+
+        try:
+            current = _launch()
+            while running:
+                remaining = self.deadline - (time.monotonic() - start)
+                if remaining <= 0:
+                    break
+                # Wait until the newest request exceeds its usual latency, then hedge
+                timeout = min(remaining, self.hedge_delay(current)) if queue else remaining
+                done, _ = wait(list(running), timeout=timeout, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    name, started = running.pop(future)
+                    latency = time.monotonic() - started
+                    try:
+                        result = future.result()
+                        if validate and not validate(result):
+                            raise ValueError("invalid response")
+                    except Exception as e:
+                        self._record(name, latency, ok=False)
+                        errors.append(f"{name}: {e}")
+                        print(f"[Router] {name} failed after {latency:.1f}s: {e}")
+                        continue
+                    self._record(name, latency, ok=True)
+                    print(f"[Router] {name} answered in {latency:.1f}s.")
+                    # Providers that were beaten are at least this slow; without this a
+                    # provider that turned slow keeps its old median and stays first
+                    for loser, loser_started in running.values():
+                        self._record(loser, time.monotonic() - loser_started)
+                    return name, result
+
+                # Nothing answered in time, or a provider failed: bring in the next one
+                if queue and time.monotonic() - start < self.deadline:
+                    if not done:
+                        print(f"[Router] {current} is slower than usual. Sending hedged request.")
+                    current = _launch()
+        finally:
+            # Losing requests finish in the background; they cannot be cancelled
+            pool.shutdown(wait=False)
+
+        for name, started in running.values():
+            self._record(name, time.monotonic() - started, ok=False)
+        raise RuntimeError(f"No provider answered within {self.deadline:.0f}s ({'; '.join(errors) or 'timeout'})")
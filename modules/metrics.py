@@ -0,0 +1,245 @@
+import os
+import sys
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+_local = threading.local()
+
+
+def _peak_rss_mb(who) -> float:
+    if resource is None:
+        return 0.0
+    peak = resource.getrusage(who).ru_maxrss
+    # Linux reports KB, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+class Stage:
+    """Measurements for one stage. Counters are thread-safe; children are sub-stages."""
+
+    def __init__(self, name: str, parent: "Stage" = None):
+        self.name = name
+        self.parent = parent
+        self.children = []
+        self.calls = {}
+        self.bytes_down = 0
+        self.bytes_up = 0
+        self.status = "running"
+        self.started = time.time()
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.child_cpu = 0.0
+        self.peak_rss_mb = 0.0
+        self.child_peak_rss_mb = 0.0
+        self._lock = threading.Lock()
+
+    def count(self, call: str = None, bytes_down: int = 0, bytes_up: int = 0):
+        with self._lock:
+            if call:
+                self.calls[call] = self.calls.get(call, 0) + 1
+            self.bytes_down += bytes_down
+            self.bytes_up += bytes_up
+
+    def child(self, name: str) -> "Stage":
+        stage = Stage(name, parent=self)
+        self.adopt(stage)
+        return stage
+
+    def take_children(self) -> list:
+        """Detaches and returns the sub-stages recorded so far."""
+        with self._lock:
+            children, self.children = self.children, []
+        return children
+
+    def adopt(self, stage: "Stage"):
+        """Makes an already measured stage a sub-stage of this one."""
+        stage.parent = self
+        with self._lock:
+            self.children.append(stage)
+
+    def totals(self) -> dict:
+        """Bytes and calls of this stage including all sub-stages."""
+        totals = {"bytes_down": self.bytes_down, "bytes_up": self.bytes_up, "calls": dict(self.calls)}
+        for child in self.children:
+            sub = child.totals()
+            totals["bytes_down"] += sub["bytes_down"]
+            totals["bytes_up"] += sub["bytes_up"]
+            for call, n in sub["calls"].items():
+                totals["calls"][call] = totals["calls"].get(call, 0) + n
+        return totals
+
+    def to_dict(self) -> dict:
+        data = {
+            "name": self.name,
+            "status": self.status,
+            "started": self.started,
+            "wall_s": round(self.wall, 3),
+            "cpu_s": round(self.cpu, 3),
+            "child_cpu_s": round(self.child_cpu, 3),
+            "peak_rss_mb": self.peak_rss_mb,
+            "child_peak_rss_mb": self.child_peak_rss_mb,
+            **self.totals(),
+        }
+        if self.children:
+            data["children"] = [c.to_dict() for c in self.children]
+        return data
+
+
+@contextmanager
+def _measure(stage: Stage):
+    previous = getattr(_local, "stage", None)
+    _local.stage = stage
+    start_wall, start_cpu, start_times = time.monotonic(), time.process_time(), os.times()
+    try:
+        yield stage
+        if stage.status == "running":
+            stage.status = "ok"
+    except BaseException:
+        stage.status = "error"
+        raise
+    finally:
+        end_times = os.times()
+        stage.wall = time.monotonic() - start_wall
+        # Process-wide CPU while the stage ran (includes concurrent stages' threads)
+        stage.cpu = time.process_time() - start_cpu
+        # Finished child processes, e.g. ffmpeg
+        stage.child_cpu = (end_times.children_user + end_times.children_system) - \
+                          (start_times.children_user + start_times.children_system)
+        if resource is not None:
+            stage.peak_rss_mb = _peak_rss_mb(resource.RUSAGE_SELF)
+            stage.child_peak_rss_mb = _peak_rss_mb(resource.RUSAGE_CHILDREN)
+        _local.stage = previous
+
+
+def current_stage() -> Stage:
+    """The stage the calling thread is running in, or None."""
+    return getattr(_local, "stage", None)
+
+
+def count(call: str = None, bytes_down: int = 0, bytes_up: int = 0):
+    """Adds an external call / transferred bytes to the calling thread's stage (no-op outside stages)."""
+    stage = current_stage()
+    if stage is not None:
+        stage.count(call, bytes_down, bytes_up)
+
+
+@contextmanager
+def substage(name: str, parent: Stage = None):
+    """Measures a sub-stage of `parent` (default: the calling thread's stage)."""
+    parent = parent or current_stage()
+    if parent is None:
+        yield None
+        return
+    with _measure(parent.child(name)) as stage:
+        yield stage
+
+
+def bind(fn, name: str, parent: Stage = None):
+    """
+    Wraps fn so that, when run on a worker thread, it is measured as sub-stage
+    `name` of `parent`, by default the stage that is current here (thread pools
+    do not inherit it).
+    """
+    parent = parent or current_stage()
+    if parent is None:
+        return fn
+
+    def _run(*args, **kwargs):
+        with substage(name, parent):
+            return fn(*args, **kwargs)
+    return _run
+
+
+class RunMetrics:
+    """
+    Per-run instrumentation: one Stage per pipeline stage (with sub-stages for
+    per-segment TTS/footage and per-platform uploads), written as JSON to
+    `report_path` after every stage.
+    """
+
+    def __init__(self, run_id: str, report_path: str = None):
+        self.run_id = run_id
+        self.report_path = report_path
+        self.started = time.time()
+        self.stages = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str):
+        stage = Stage(name)
+        with self._lock:
+            self.stages.append(stage)
+        try:
+            with _measure(stage):
+                yield stage
+        finally:
+            self.save()
+
+    def skipped(self, name: str):
+        """Records a stage restored from the manifest on resume."""
+        stage = Stage(name)
+        stage.status = "skipped"
+        with self._lock:
+            self.stages.append(stage)
+
+    def ran(self) -> bool:
+        """True if any stage actually ran (rather than being restored on resume)."""
+        with self._lock:
+            return any(s.status != "skipped" for s in self.stages)
+
+    def report(self) -> dict:
+        with self._lock:
+            stages = [s.to_dict() for s in self.stages]
+        return {
+            "run_id": self.run_id,
+            "started": self.started,
+            "wall_s": round(time.time() - self.started, 3),
+            "stages": stages,
+        }
+
+    def summary(self) -> dict:
+        """Flat per-run totals for the history store."""
+        report = self.report()
+        measured = [s for s in report["stages"] if s["status"] != "skipped"]
+        calls = {}
+        for s in measured:
+            for call, n in s["calls"].items():
+                calls[call] = calls.get(call, 0) + n
+        return {
+            "run_id": self.run_id,
+            "started": self.started,
+            "wall_s": report["wall_s"],
+            "cpu_s": round(sum(s["cpu_s"] for s in measured), 3),
+            "child_cpu_s": round(sum(s["child_cpu_s"] for s in measured), 3),
+            "peak_rss_mb": max((s["peak_rss_mb"] for s in measured), default=0.0),
+            "bytes_down": sum(s["bytes_down"] for s in measured),
+            "bytes_up": sum(s["bytes_up"] for s in measured),
+            "calls": calls,
+            "stage_wall_s": {s["name"]: s["wall_s"] for s in measured},
+        }
+
+    def save(self):
+        if not self.report_path:
+            return
+        try:
+            tmp_path = f"{self.report_path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(self.report(), f, indent=2)
+            os.replace(tmp_path, self.report_path)
+        except OSError as e:
+            print(f"Warning: could not write metrics report: {e}")
+
+    def print_summary(self):
+        summary = self.summary()
+        print(f"--- Run metrics ({self.run_id}): {summary['wall_s']:.1f}s wall, {summary['cpu_s']:.1f}s CPU "
+              f"(+{summary['child_cpu_s']:.1f}s ffmpeg), peak RSS {summary['peak_rss_mb']}MB, "
+              f"{summary['bytes_down'] / (1024*1024):.1f}MB down / {summary['bytes_up'] / (1024*1024):.1f}MB up ---")
+        for name, wall in sorted(summary["stage_wall_s"].items(), key=lambda kv: -kv[1]):
+            print(f"  {name:<12} {wall:8.1f}s")
@@ -0,0 +1,52 @@
+import importlib
+import threading
+
+# (kind, name) -> "module" or "module:attribute". Nothing is imported until
+# load() is first called for that provider, so a CLI run that never renders
+# with MoviePy or never calls Gemini does not pay for those imports.
+PROVIDERS = {
+    ("llm", "openai"): "openai:OpenAI",
+    ("llm", "gemini"): "google.generativeai",
+    ("tts", "elevenlabs"): "elevenlabs:ElevenLabs",
+    ("tts", "edge_tts"): "edge_tts",
+    ("render", "moviepy"): "moviepy",
+    ("render", "ffmpeg"): "modules.ffmpeg_renderer:FFmpegRenderer",
+    ("render", "parallel"): "modules.ffmpeg_renderer:ParallelSegmentRenderer",
+}
+
+_loaded = {}
+_lock = threading.Lock()
+
+
+def register(kind: str, name: str, target: str):
+    """Adds or replaces a provider, e.g. register('tts', 'piper', 'piper_tts:PiperVoice')."""
+    with _lock:
+        PROVIDERS[(kind, name)] = target
+        _loaded.pop((kind, name), None)
+
+
+def names(kind: str) -> list:
+    return [name for k, name in PROVIDERS if k == kind]
+
+
+def load(kind: str, name: str):
+    """
+    Imports the provider on first use and returns the module (or attribute).
+    Returns None if its package is not installed; the warning is printed once.
+    """
+    key = (kind, name)
+    with _lock:
+        if key in _loaded:
+            return _loaded[key]
+        target = PROVIDERS.get(key)
+        if target is None:
+            raise KeyError(f"Unknown {kind} provider '{name}'")
+        module_name, _, attr = target.partition(":")
+        try:
+            module = importlib.import_module(module_name)
+            value = getattr(module, attr) if attr else module
+        except ImportError as e:
+            print(f"Warning: {kind} provider '{name}' unavailable ({e}).")
+            value = None
+        _loaded[key] = value
+        return value
@@ -0,0 +1,104 @@
+import os
+import json
+import time
+import uuid
+from datetime import datetime
+
+from modules.metrics import RunMetrics
+
+RUNS_DIR = os.getenv("RUNS_DIR", "runs")
+
+
+class RunManifest:
+    """
+    One directory per pipeline execution (runs/<run-id>/) with a manifest.json
+    recording the outputs of every completed stage, so a crashed run can be
+    resumed without repeating LLM calls, TTS, downloads or renders.
+    """
+
+    def __init__(self, run_id: str = None, runs_dir: str = None):
+        self.runs_dir = runs_dir or RUNS_DIR
+        if run_id == "latest":
+            run_id = self.latest_run_id(self.runs_dir)
+            if not run_id:
+                raise FileNotFoundError(f"No previous runs found in {self.runs_dir}")
+
+        self.resumed = run_id is not None
+        self.run_id = run_id or f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        self.run_dir = os.path.join(self.runs_dir, self.run_id)
+        self.path = os.path.join(self.run_dir, "manifest.json")
+
+        if self.resumed:
+            if not os.path.exists(self.path):
+                raise FileNotFoundError(f"Run '{self.run_id}' has no manifest at {self.path}")
+            with open(self.path, 'r') as f:
+                self.data = json.load(f)
+        else:
+            os.makedirs(self.run_dir, exist_ok=True)
+            self.data = {"run_id": self.run_id, "created": time.time(), "stages": {}}
+            self._save()
+
+        # Timing/resource report for this invocation (a resumed run gets its own file)
+        report_name = f"metrics-resumed-{datetime.now().strftime('%H%M%S')}.json" if self.resumed else "metrics.json"
+        self.metrics = RunMetrics(self.run_id, report_path=self.path_for(report_name))
+
+    @staticmethod
+    def latest_run_id(runs_dir: str = None):
+        runs_dir = runs_dir or RUNS_DIR
+        if not os.path.exists(runs_dir):
+            return None
+        runs = [d for d in os.listdir(runs_dir) if os.path.exists(os.path.join(runs_dir, d, "manifest.json"))]
+        return max(runs) if runs else None  # Run ids start with a sortable timestamp
+
+    def _save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.data, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def path_for(self, name: str) -> str:
+        """Location for a file produced by this run (e.g. the rendered video)."""
+        return os.path.join(self.run_dir, name)
+
+    def is_done(self, stage: str) -> bool:
+        return stage in self.data["stages"]
+
+    def get(self, stage: str, default=None):
+        entry = self.data["stages"].get(stage)
+        return entry["outputs"] if entry else default
+
+    def complete(self, stage: str, outputs=None):
+        self.data["stages"][stage] = {"completed": time.time(), "outputs": outputs}
+        self.data.get("partial", {}).pop(stage, None)
+        self._save()
+
+    def partial(self, stage: str, default=None):
+        """Outputs saved by an incomplete stage (e.g. the uploads that did succeed)."""
+        return self.data.get("partial", {}).get(stage, default)
+
+    def save_partial(self, stage: str, outputs):
+        """Records progress of a stage without marking it complete, so a resume picks up from here."""
+        self.data.setdefault("partial", {})[stage] = outputs
+        self._save()
+
+    def invalidate(self, stage: str):
+        """Forces a stage to run again (e.g. its files were deleted)."""
+        if self.data["stages"].pop(stage, None) is not None:
+            self._save()
+
+    def run_stage(self, stage: str, fn):
+        """
+        Returns the recorded outputs of `stage`, or runs `fn()` and records its
+        result. A None result means the stage failed and is not recorded.
+        """
+        if self.is_done(stage):
+            print(f"[Resume] Skipping completed stage '{stage}'.")
+            self.metrics.skipped(stage)
+            return self.get(stage)
+        with self.metrics.stage(stage) as measured:
+            outputs = fn()
+            if outputs is None:
+                measured.status = "failed"
+        if outputs is not None:
+            self.complete(stage, outputs)
+        return outputs
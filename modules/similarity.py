@@ -0,0 +1,64 @@
+import re
+import zlib
+import numpy as np
+
+
+class SimilarityIndex:
+    """
+    Local near-duplicate detector for titles/hooks. Texts are embedded as hashed
+    character n-gram + word TF-IDF vectors (NumPy only, no network) and compared
+    by cosine similarity, so scoring a candidate against thousands of past videos
+    is a single matrix-vector product.
+    """
+
+    def __init__(self, dim: int = 4096, ngram_sizes=(3, 4)):
+        self.dim = dim
+        self.ngram_sizes = ngram_sizes
+        self.texts = []
+        self.matrix = np.zeros((0, dim), dtype=np.float32)
+        self.idf = np.ones(dim, dtype=np.float32)
+
+    def _features(self, text: str) -> list:
+        words = re.sub(r"[^a-z0-9$%&]+", " ", text.lower()).split()
+        features = list(words)
+        for word in words:
+            padded = f" {word} "
+            for n in self.ngram_sizes:
+                features += [padded[i:i + n] for i in range(len(padded) - n + 1)]
+        # crc32 instead of hash(): stable across processes
+        return [zlib.crc32(f.encode("utf-8")) % self.dim for f in features]
+
+    def _counts(self, texts: list) -> np.ndarray:
+        counts = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            np.add.at(counts[row], self._features(text), 1.0)
+        return counts
+
+    @staticmethod
+    def _normalize(matrix: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+        return matrix / np.maximum(norms, 1e-9)
+
+    def build(self, texts: list):
+        """(Re)builds the index over `texts`."""
+        self.texts = list(texts)
+        counts = self._counts(self.texts)
+        doc_freq = (counts > 0).sum(axis=0)
+        self.idf = (np.log((1 + len(self.texts)) / (1 + doc_freq)) + 1).astype(np.float32)
+        self.matrix = self._normalize(np.log1p(counts) * self.idf)
+        return self
+
+    def scores(self, text: str) -> np.ndarray:
+        """Cosine similarity of `text` against every indexed text."""
+        if not self.texts:
+            return np.zeros(0, dtype=np.float32)
+        vec = self._normalize(np.log1p(self._counts([text])[0]) * self.idf)
+        return self.matrix @ vec
+
+    def most_similar(self, text: str):
+        """Returns (score, matched_text); (0.0, None) for an empty index."""
+        scores = self.scores(text)
+        if not len(scores):
+            return 0.0, None
+        best = int(np.argmax(scores))
+        return float(scores[best]), self.texts[best]
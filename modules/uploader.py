@@ -1,7 +1,28 @@
 from abc import ABC, abstractmethod
 import os
+import json
+import mmap
+import time
+
+from modules.http_client import HTTPClient, get_client
 
 class Uploader(ABC):
+    """
+    Platform uploader. Implementations either override upload() only, or also
+    implement the resumable protocol (start_session / send_chunk / query_offset /
+    finish_session), which lets upload_resumable() send the file in chunks and
+    continue from the committed offset after a failure or a restarted run.
+    """
+    supports_resumable = False
+    profile = None  # Output profile this platform wants (see OUTPUT_PROFILES); None = master file
+    mock = False  # Placeholder that sends nothing; no profile encode is made for it
+    chunk_size = int(os.getenv("UPLOAD_CHUNK_MB", "8")) * 1024 * 1024
+    max_chunk_retries = 5
+
+    def __init__(self, http: HTTPClient = None):
+        # Platform API calls go through the shared pooled client
+        self.http = http or get_client()
+
     @abstractmethod
     def upload(self, video_path: str, title: str, description: str):
         pass
@@ -10,7 +31,142 @@ class Uploader(ABC):
     def post_comment(self, video_id: str, text: str):
         pass
 
+    # --- Resumable protocol ---
+
+    def start_session(self, total_size: int, title: str, description: str) -> dict:
+        """Opens an upload session. Returns JSON-serializable session state (e.g. the upload URL)."""
+        raise NotImplementedError
+
+    def send_chunk(self, session: dict, chunk, offset: int, total_size: int) -> int:
+        """Sends bytes [offset, offset+len(chunk)). Returns the offset the server has committed."""
+        raise NotImplementedError
+
+    def query_offset(self, session: dict, total_size: int) -> int:
+        """Asks the server how many bytes it has committed (used to resume)."""
+        raise NotImplementedError
+
+    def finish_session(self, session: dict):
+        """Returns the platform video id once all bytes are committed."""
+        return session.get("video_id")
+
+    def _load_session(self, state_path: str, total_size: int):
+        if not state_path or not os.path.exists(state_path):
+            return None
+        try:
+            with open(state_path, 'r') as f:
+                session = json.load(f)
+        except Exception:
+            return None
+        return session if session.get("total") == total_size else None
+
+    @staticmethod
+    def _save_session(state_path: str, session: dict):
+        if not state_path:
+            return
+        os.makedirs(os.path.dirname(state_path) or ".", exist_ok=True)
+        tmp_path = f"{state_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(session, f)
+        os.replace(tmp_path, state_path)
+
+    def upload_resumable(self, data, title: str, description: str, state_path: str = None):
+        """
+        Uploads `data` (bytes-like, e.g. a memoryview over an mmap) in chunks.
+        The session is saved to `state_path`, so a later call resumes it instead
+        of starting over. Returns the platform video id.
+        """
+        name = type(self).__name__
+        total = len(data)
+        session = self._load_session(state_path, total)
+        if session:
+            offset = self.query_offset(session, total)
+            print(f"[{name}] Resuming upload at {offset / (1024*1024):.1f}/{total / (1024*1024):.1f}MB.")
+        else:
+            session = self.start_session(total, title, description)
+            session["total"] = total
+            offset = 0
+        self._save_session(state_path, session)
+
+        failures = 0
+        while offset < total:
+            chunk = data[offset:offset + self.chunk_size]
+            try:
+                offset = self.send_chunk(session, chunk, offset, total)
+                failures = 0
+            except Exception as e:
+                failures += 1
+                if failures > self.max_chunk_retries:
+                    raise
+                delay = min(2 ** failures, 30)
+                print(f"[{name}] Chunk at {offset} failed ({e}). Resuming in {delay}s...")
+                time.sleep(delay)
+                offset = self.query_offset(session, total)
+            finally:
+                if isinstance(chunk, memoryview):
+                    chunk.release()
+            session["offset"] = offset
+            self._save_session(state_path, session)
+
+        video_id = self.finish_session(session)
+        if state_path and os.path.exists(state_path):
+            os.remove(state_path)
+        return video_id
+
+
+class ResumableHTTPUploader(Uploader):
+    """
+    Generic resumable upload over HTTP (the scheme YouTube's resumable uploads use):
+    POST metadata to `init_url` -> upload URL in the Location header; PUT chunks
+    with Content-Range; 308 + Range means "continue", 200/201 returns {"id": ...}.
+    """
+    supports_resumable = True
+
+    def __init__(self, init_url: str, headers: dict = None, http: HTTPClient = None):
+        super().__init__(http)
+        self.init_url = init_url
+        self.headers = headers or {}
+
+    def start_session(self, total_size: int, title: str, description: str) -> dict:
+        r = self.http.post(self.init_url, json={"title": title, "description": description, "size": total_size},
+                           headers=self.headers, retry=True)
+        r.raise_for_status()
+        return {"upload_url": r.headers["Location"]}
+
+    def _committed(self, session: dict, r, total_size: int) -> int:
+        if r.status_code in (200, 201):
+            session["video_id"] = r.json().get("id")
+            return total_size
+        if r.status_code == 308:
+            committed = r.headers.get("Range")  # "bytes=0-1234" (inclusive)
+            return int(committed.rsplit("-", 1)[1]) + 1 if committed else 0
+        raise RuntimeError(f"Upload failed with HTTP {r.status_code}: {r.text[:200]}")
+
+    def send_chunk(self, session: dict, chunk, offset: int, total_size: int) -> int:
+        headers = dict(self.headers, **{"Content-Range": f"bytes {offset}-{offset + len(chunk) - 1}/{total_size}"})
+        # Failed chunks are resumed via query_offset, not resent blindly
+        r = self.http.request("PUT", session["upload_url"], data=chunk, headers=headers, retry=False)
+        return self._committed(session, r, total_size)
+
+    def query_offset(self, session: dict, total_size: int) -> int:
+        headers = dict(self.headers, **{"Content-Range": f"bytes */{total_size}"})
+        r = self.http.request("PUT", session["upload_url"], data=b"", headers=headers)
+        return self._committed(session, r, total_size)
+
+    def upload(self, video_path: str, title: str, description: str):
+        with open(video_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            view = memoryview(mm)
+            try:
+                return self.upload_resumable(view, title, description)
+            finally:
+                view.release()
+
+    def post_comment(self, video_id: str, text: str):
+        print(f"[{type(self).__name__}] Comments are not supported by this endpoint ({video_id}).")
+
 class YouTubeUploader(Uploader):
+    profile = "youtube"
+    mock = True
+
     def upload(self, video_path: str, title: str, description: str):
         print(f"[YouTube] Uploading {video_path}...")
         # TODO: Google API
@@ -20,6 +176,9 @@ class YouTubeUploader(Uploader):
          print(f"[YouTube] Posting comment on {video_id}: {text}")
 
 class TikTokUploader(Uploader):
+    profile = "tiktok"
+    mock = True
+
     def upload(self, video_path: str, title: str, description: str):
         print(f"[TikTok] Uploading {video_path}...")
         # TODO: Selenium/Unofficial API
@@ -29,6 +188,9 @@ class TikTokUploader(Uploader):
          print(f"[TikTok] Posting comment on {video_id}: {text}")
 
 class InstagramUploader(Uploader):
+    profile = "instagram"
+    mock = True
+
     def upload(self, video_path: str, title: str, description: str):
         print(f"[Instagram] Uploading {video_path}...")
         # TODO: Instagram Graph API or Selenium
@@ -38,6 +200,9 @@ class InstagramUploader(Uploader):
          print(f"[Instagram] Posting comment on {video_id}: {text}")
 
 class FacebookUploader(Uploader):
+    profile = "facebook"
+    mock = True
+
     def upload(self, video_path: str, title: str, description: str):
         print(f"[Facebook] Uploading {video_path}...")
         # TODO: Graph API
@@ -1,16 +1,133 @@
-from moviepy import *
 import random
 import os
 
+from modules import providers
+from modules.captions import CaptionSprites, FRAME_WIDTH, MOCK_DURATION, plan_overlays
+from modules.ffmpeg_renderer import OUTPUT_PROFILES, encode_profiles, is_proxy, narration_duration, proxy_source
+
+ASSETS_DIR = os.path.join(os.path.dirname(__file__), "..", "assets")
+# Backends are resolved through the provider registry, so MoviePy is only
+# imported when a MoviePy render (or fallback) actually happens
+RENDER_ENGINES = tuple(providers.names("render"))
+
 class VideoEditor:
-    def create_multiclip_video(self, segments_data: list, output_path: str, bg_music_path: str = None, remove_watermark: bool = True):
+    def __init__(self, engine: str = None, preset: str = None, threads: int = None, assets_dir: str = None):
+        """
+        engine: 'moviepy' (Python compositing, default), 'ffmpeg' (single
+        filter_complex graph, much faster) or 'parallel' (per-segment renders on
+        all cores, cached, joined without re-encoding). Defaults to RENDER_ENGINE env var.
+        preset / threads: x264 settings (default ultrafast; 1 thread for MoviePy,
+        automatic for FFmpeg). assets_dir: music, disclaimer.png and
+        fallback_background.png (default: the repo's assets/).
+        """
+        self.engine = engine or os.getenv("RENDER_ENGINE", "moviepy")
+        self.preset = preset or os.getenv("RENDER_PRESET", "ultrafast")
+        self.threads = threads
+        self.assets_dir = assets_dir or ASSETS_DIR
+        self._sprites = None
+        if self.engine not in RENDER_ENGINES:
+            print(f"Warning: unknown render engine '{self.engine}'. Using moviepy.")
+            self.engine = "moviepy"
+        # Captions cost little in the FFmpeg graph but add ~70% to a MoviePy
+        # render, so MoviePy only gets them when CAPTIONS=1 is set explicitly
+        self.captions = os.getenv("CAPTIONS", "1" if self.engine in ("ffmpeg", "parallel") else "0") != "0"
+
+    def _select_music(self, bg_music_path: str = None):
+        """Uses the given track, or rotates through assets/music."""
+        music_file = bg_music_path
+        music_dir = os.path.join(self.assets_dir, "music")
+        
+        if not music_file and os.path.exists(music_dir):
+            files = [f for f in os.listdir(music_dir) if f.endswith(".mp3")]
+            if files:
+                music_file = os.path.join(music_dir, random.choice(files))
+                print(f"Selected viral background music: {music_file}")
+        if music_file and os.path.exists(music_file):
+            return music_file
+        return None
+
+    def _disclaimer_path(self):
+        path = os.path.join(self.assets_dir, "disclaimer.png")
+        if os.path.exists(path):
+            return path
+        print("Warning: disclaimer.png not found in assets. Skipping visual disclaimer.")
+        return None
+
+    def _with_overlays(self, segments_data: list, idea: dict = None) -> list:
+        """
+        Copies of the segments with their caption / flash prompt overlays
+        planned (seg['overlays']) and narration durations filled in.
+        """
+        if not self.captions:
+            return segments_data
+        try:
+            if self._sprites is None:
+                self._sprites = CaptionSprites()
+            usable = [seg for seg in segments_data if os.path.exists(seg['audio']) and os.path.exists(seg['video'])]
+            measured = [narration_duration(seg) for seg in usable]
+            plans = plan_overlays(usable, [d or MOCK_DURATION for d in measured], idea, self._sprites)
+        except Exception as e:
+            print(f"Warning: could not prepare captions ({e}). Rendering without them.")
+            return segments_data
+        planned = {id(seg): dict(seg, overlays=plan, duration=d) if d else dict(seg, overlays=plan)
+                   for seg, d, plan in zip(usable, measured, plans)}
+        return [planned.get(id(seg), seg) for seg in segments_data]
+
+    def create_profile_outputs(self, master_path: str, profiles: list) -> dict:
+        """
+        Encodes the rendered master into the named OUTPUT_PROFILES (e.g. 'youtube',
+        'telegram') in a single ffmpeg pass. Files are written next to the master
+        as <name>_<profile>.mp4. Returns {profile: path}; unknown names are skipped,
+        profiles with the same settings share one file, and size-capped profiles
+        the master already fits map to the master.
+        """
+        base, ext = os.path.splitext(master_path)
+        outputs = {}
+        for name in profiles:
+            if name in OUTPUT_PROFILES:
+                outputs[name] = f"{base}_{name}{ext}"
+            else:
+                print(f"Warning: unknown output profile '{name}'. Skipping.")
+        return encode_profiles(master_path, outputs)
+
+    def create_multiclip_video(self, segments_data: list, output_path: str, bg_music_path: str = None,
+                               remove_watermark: bool = True, idea: dict = None):
         """
         Assembles a video from multiple [audio, video] segments.
-        segments_data: List of dicts {'audio': path, 'video': path}
+        segments_data: List of dicts {'audio': path, 'video': path}, optionally
+        with 'text' and TTS 'words' timings for the captions.
+        idea: supplies caption_keywords and the flash prompt. Captions are on
+        by default for the ffmpeg and parallel engines; CAPTIONS=1/0 overrides.
         """
+        if not remove_watermark:
+            # Proxies have the watermark crop baked in; use the original clips instead
+            segments_data = [dict(seg, video=proxy_source(seg['video'])) for seg in segments_data]
+        segments_data = self._with_overlays(segments_data, idea)
+        if self.engine in ("ffmpeg", "parallel"):
+            renderer_cls = providers.load("render", self.engine)
+            renderer = renderer_cls(preset=self.preset, threads=self.threads or 0)
+            try:
+                return renderer.render(
+                    segments_data, output_path,
+                    music_path=self._select_music(bg_music_path),
+                    disclaimer_path=self._disclaimer_path(),
+                    remove_watermark=remove_watermark,
+                    fallback_image=os.path.join(self.assets_dir, "fallback_background.png")
+                )
+            except Exception as e:
+                print(f"FFmpeg render failed ({e}). Falling back to MoviePy.")
+        return self._render_moviepy(segments_data, output_path, bg_music_path, remove_watermark)
+
+    def _render_moviepy(self, segments_data: list, output_path: str, bg_music_path: str = None, remove_watermark: bool = True):
+        if providers.load("render", "moviepy") is None:
+            print("MoviePy is not installed. Cannot render.")
+            return None
+        from moviepy import (AudioFileClip, VideoFileClip, ImageClip, ColorClip, CompositeAudioClip,
+                             CompositeVideoClip, concatenate_videoclips, vfx)
         try:
             clips = []
-            
+            sprites = {}  # Sprite image -> ImageClip, shared by every segment
+
             for seg in segments_data:
                 a_path = seg['audio']
                 v_path = seg['video']
@@ -36,7 +153,7 @@ class VideoEditor:
                     video_clip = VideoFileClip(v_path)
                 else:
                     # Mock Video (Fallback to Professional Background)
-                    bg_path = os.path.join(os.path.dirname(__file__), "..", "assets", "fallback_background.png")
+                    bg_path = os.path.join(self.assets_dir, "fallback_background.png")
                     if os.path.exists(bg_path):
                          # Create Image Clip with Zoom
                          img = ImageClip(bg_path).with_duration(duration).resized(height=1920)
@@ -56,8 +173,8 @@ class VideoEditor:
                 if audio_clip:
                      video_clip = video_clip.with_audio(audio_clip)
 
-                # Zoom/Crop for Watermark Removal (1.1x)
-                if remove_watermark:
+                # Zoom/Crop for Watermark Removal (1.1x); proxies are already cropped
+                if remove_watermark and not is_proxy(v_path):
                      w, h = video_clip.size
                      video_clip = video_clip.resized(1.1)
                      video_clip = video_clip.cropped(x_center=video_clip.w/2, y_center=video_clip.h/2, width=w, height=h)
@@ -69,6 +186,10 @@ class VideoEditor:
                      w, h = video_clip.size
                      video_clip = video_clip.cropped(x1=w*0.1, y1=h*0.1, x2=w*0.9, y2=h*0.9).resized(new_size=(w, h))
 
+                # FLASH PROMPT & CAPTIONS (Hormozi Style): cached sprites placed by time and position
+                if seg.get("overlays"):
+                    video_clip = CompositeVideoClip([video_clip, *self._sprite_clips(seg["overlays"], video_clip.size, sprites)])
+
                 clips.append(video_clip)
 
             if not clips:
@@ -79,17 +200,10 @@ class VideoEditor:
             final_clip = concatenate_videoclips(clips, method="compose")
 
             # Audio Rotation Logic
-            music_file = bg_music_path
-            music_dir = os.path.join(os.path.dirname(__file__), "..", "assets", "music")
-            
-            if not music_file and os.path.exists(music_dir):
-                files = [f for f in os.listdir(music_dir) if f.endswith(".mp3")]
-                if files:
-                    music_file = os.path.join(music_dir, random.choice(files))
-                    print(f"Selected viral background music: {music_file}")
+            music_file = self._select_music(bg_music_path)
 
             # Add Background Music (if provided or found)
-            if music_file and os.path.exists(music_file):
+            if music_file:
                 try:
                     music = AudioFileClip(music_file)
                     music = music.with_effects([vfx.Loop(duration=final_clip.duration)])
@@ -101,13 +215,10 @@ class VideoEditor:
                 except Exception as e:
                     print(f"Warning: Could not load background music ({e}). Proceeding without music.")
 
-            # FLASH PROMPT & CAPTIONS (Hormozi Style)
-            # ... (Existing logic)
-
             # SAFETY DISCLAIMER (Mandatory)
             # Adds "Not Financial Advice" to bottom of screen for safety
-            disclaimer_path = os.path.join(os.path.dirname(__file__), "..", "assets", "disclaimer.png")
-            if os.path.exists(disclaimer_path):
+            disclaimer_path = self._disclaimer_path()
+            if disclaimer_path:
                 try:
                     print("Adding safety disclaimer overlay...")
                     # Create disclaimer clip (bottom third)
@@ -122,8 +233,6 @@ class VideoEditor:
                     print("✅ Disclaimer added.")
                 except Exception as e:
                     print(f"Could not add disclaimer visual: {e}")
-            else:
-                print("Warning: disclaimer.png not found in assets. Skipping visual disclaimer.")
 
             # Export with Retry Logic
             # Export with Retry Logic
@@ -134,14 +243,14 @@ class VideoEditor:
                     fps=24, 
                     codec='libx264', 
                     audio_codec='aac', 
-                    threads=1, 
-                    preset='ultrafast',
+                    threads=self.threads or 1, 
+                    preset=self.preset,
                     temp_audiofile='temp-audio.m4a', 
                     remove_temp=True
                 )
             except Exception as err:
                 print(f"Render failed ({err}). Retrying with minimal settings...")
-                final_clip.write_videofile(output_path, fps=24, codec='libx264', threads=1)
+                final_clip.write_videofile(output_path, fps=24, codec='libx264', threads=self.threads or 1)
             
             return output_path
 
@@ -151,6 +260,25 @@ class VideoEditor:
             traceback.print_exc()
             return None
 
+    @staticmethod
+    def _sprite_clips(overlays: list, size: tuple, loaded: dict) -> list:
+        """ImageClips for a segment's overlays. Each sprite file is decoded (and scaled to the frame) once."""
+        import numpy as np
+        from PIL import Image
+        from moviepy import ImageClip
+        w, h = size
+        clips = []
+        for o in overlays:
+            base = loaded.get(o["image"])
+            if base is None:
+                image = Image.open(o["image"]).convert("RGBA")
+                if w != FRAME_WIDTH:
+                    image = image.resize((max(int(image.width * w / FRAME_WIDTH), 1), max(int(image.height * w / FRAME_WIDTH), 1)))
+                base = loaded[o["image"]] = ImageClip(np.array(image))
+            clips.append(base.with_start(o["start"]).with_duration(o["end"] - o["start"])
+                         .with_position(("center", h * o["y"] - base.h / 2)))
+        return clips
+
     def create_viral_video(self, audio_path: str, visual_path: str, output_path: str, script_data: dict, remove_watermark: bool = True):
         # Legacy single-clip method (kept for fallback)
         pass 